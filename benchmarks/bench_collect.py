@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# Measures refreshing and scraping synthesized or recorded eero accounts, without the eero cloud
+#
+#   python -m benchmarks.bench_collect -scales 1x3x20,4x5x50,16x8x100
+#   python -m benchmarks.bench_collect -fixture home.json -http
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client.core import CollectorRegistry
+from prometheus_client.exposition import generate_latest
+from wsgiref.util import setup_testing_defaults
+import eero_exporter
+import replay
+import time
+import tracemalloc
+import transport
+
+
+def measure(run, repeat):
+    """Best wall and cpu seconds of repeat runs"""
+    wall, cpu = [], []
+    for _ in range(repeat):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        run()
+        wall.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - start_cpu)
+    return min(wall), min(cpu)
+
+
+def peak_memory(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def scrape(app, accept_encoding = None):
+    environ = {}
+    setup_testing_defaults(environ)
+    environ['PATH_INFO'] = '/metrics'
+    if accept_encoding:
+        environ['HTTP_ACCEPT_ENCODING'] = accept_encoding
+    return b"".join(app(environ, lambda status, headers: None))
+
+
+def bench(name, fixture, args, executor):
+    server = None
+    if args.http:
+        server = replay.ReplayServer(fixture, latency = args.latency).start()
+        api = replay.eero_api.Eero(replay.ReplaySession())
+        api.client = transport.PooledClient(10, args.concurrency, api_endpoint = server.api_endpoint)
+    else:
+        api = replay.replay_api(fixture)
+    try:
+        poller = eero_exporter.Poller(api, 60, args.concurrency, builder_options = args.builder_options, executor = executor)
+        poller.refresh()
+        if poller.snapshot is None:
+            raise SystemExit(name + ": refresh failed")
+        samples = sum(len(family.samples) for family in poller.snapshot.families)
+        # extractors slicing strings instead of parsing them export strings, prometheus_client doesn't check
+        invalid = sorted({family.name for family in poller.snapshot.families for sample in family.samples
+                          if isinstance(sample.value, bool) or not isinstance(sample.value, (int, float))})
+        if invalid:
+            raise SystemExit(name + ": non-numeric samples in " + ", ".join(invalid))
+
+        uncached = CollectorRegistry(auto_describe = False)
+        uncached.register(eero_exporter.JsonCollector([poller]))
+        app = eero_exporter.make_app([poller], CollectorRegistry(auto_describe = False))
+        body = scrape(app)
+
+        results = [
+            ("refresh", measure(poller.refresh, args.repeat), peak_memory(poller.refresh)),
+            ("collect", measure(lambda: generate_latest(uncached), args.repeat), peak_memory(lambda: generate_latest(uncached))),
+            ("scrape", measure(lambda: scrape(app), args.repeat), None),
+            ("scrape gzip", measure(lambda: scrape(app, 'gzip'), args.repeat), None),
+        ]
+    finally:
+        if server is not None:
+            server.stop()
+
+    print("{} {} samples, {} KiB exposition".format(name, samples, len(body) // 1024))
+    for step, (wall, cpu), peak in results:
+        print("  {:<12} {:9.2f} ms {:9.2f} ms cpu {:>12}".format(step, wall * 1000, cpu * 1000, "" if peak is None else "{:,} KiB peak".format(peak // 1024)))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-scales", help="comma separated networks x eeros x clients per network to synthesize", default="1x3x20,4x5x50,16x8x100")
+    parser.add_argument("-fixture", help="recorded fixture to replay instead of synthesized accounts")
+    parser.add_argument("-http", help="go through the pooled transport and a local replay server", action="store_true")
+    parser.add_argument("-latency", help="seconds the replay server delays every response by", default=0, type=float)
+    parser.add_argument("-concurrency", help="concurrent requests, as for the exporter", default=8, type=int)
+    parser.add_argument("-client-mode", help="clients, aggregate or both", default="clients")
+    parser.add_argument("-repeat", help="runs per measurement, the best is reported", default=5, type=int)
+    args = parser.parse_args()
+    args.builder_options = {"client_mode": args.client_mode}
+
+    if args.fixture:
+        fixtures = [(args.fixture, replay.load(args.fixture))]
+    else:
+        fixtures = []
+        for scale in args.scales.split(","):
+            networks, eeros, clients = (int(n) for n in scale.split("x"))
+            fixtures.append((scale, replay.synthesize(networks, eeros, clients)))
+
+    executor = ThreadPoolExecutor(max_workers = args.concurrency)
+    for name, fixture in fixtures:
+        bench(name, fixture, args, executor)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# Compares the old strptime based timestamp parsing with metric_schema.parse_timestamp
+#
+#   python -m benchmarks.bench_timestamps
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+import timeit
+import metric_schema
+
+
+def strptime_timestamp(value):
+    return datetime.timestamp(datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ"))
+
+
+def parse_all(parse, values):
+    for value in values:
+        parse(value)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-clients", help="distinct timestamps per refresh, roughly one per client", default=500, type=int)
+    parser.add_argument("-refreshes", help="refreshes to simulate, timestamps repeat between refreshes", default=10, type=int)
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    values = [(start + timedelta(seconds=i, milliseconds=i % 1000)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z" for i in range(args.clients)]
+    workload = values * args.refreshes
+
+    uncached = metric_schema.parse_timestamp.__wrapped__
+    results = [
+        ("strptime", lambda: parse_all(strptime_timestamp, workload)),
+        ("fromisoformat", lambda: parse_all(uncached, workload)),
+        ("fromisoformat + memo", lambda: (metric_schema.parse_timestamp.cache_clear(), parse_all(metric_schema.parse_timestamp, workload))),
+    ]
+    print("parsing " + str(len(workload)) + " timestamps (" + str(args.clients) + " distinct)")
+    baseline = None
+    for name, run in results:
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        baseline = baseline or best
+        print("{:<22} {:8.2f} ms  {:6.1f}x".format(name, best * 1000, baseline / best))
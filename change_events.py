@@ -0,0 +1,199 @@
+"""Change events between consecutive refreshes: clients joining, leaving, roaming between eeros or changing band or
+channel, and eeros losing or regaining their heartbeat"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from metric_schema import EERO_LABELS, client_band, network_label_values
+from prometheus_client import Counter
+from prometheus_client.core import CounterMetricFamily
+import json
+import logging
+import requests
+import threading
+
+log = logging.getLogger("eero_exporter.events")
+
+EVENT_SINK_ERRORS = Counter('eero_exporter_event_sink_errors', 'Change events that could not be delivered, by sink', ['sink'])
+
+# counted per eero, roams count out of the eero left and into the eero joined
+CLIENT_EVENTS = ["join", "leave", "roam_in", "roam_out", "band_change", "channel_change"]
+HEARTBEAT_CHANGES = ["lost", "restored"]
+
+ClientState = namedtuple('ClientState', ['connected', 'eero_id', 'eero_name', 'band', 'channel', 'hostname', 'display_name'])
+
+
+def client_state(client):
+    return ClientState(client["connected"], client["source"]["url"].split('/')[3], client["source"]["location"],
+                       client_band(client), client.get("channel"), client["hostname"], client["display_name"])
+
+
+class ChangeTracker(object):
+    """Diffs each refresh of a network against the previous one, keyed by client MAC and eero id
+
+    The first refresh of a network is its baseline and produces no events. Counts accumulate for as long as the
+    eero stays on the network, and are labelled with its latest name. Only used from the polling thread.
+    """
+    def __init__(self, account = None):
+        self.account = account
+        self.account_labels = ["account"] if account is not None else []
+        self.account_values = [account] if account is not None else []
+        # network url -> (network details, clients, eeros, {mac: ClientState}, {eero id: (eero name, heartbeat ok)})
+        self.previous = {}
+        # network url -> {(event, eero id): count}
+        self.client_events = {}
+        self.heartbeat_changes = {}
+        # network url -> (network label values, {eero id: eero name})
+        self.labels = {}
+
+    def update(self, network, details, clients, now, network_eeros = None):
+        """Events of network since its last refresh, with eeros read from network_eeros when given as FamilyBuilder does
+
+        Everything that can fail on unexpected data runs before any state changes, so a network that raises is
+        diffed against the same baseline next time.
+        """
+        previous = self.previous.get(network["url"])
+        if previous is not None and previous[0] is details and previous[1] is clients and previous[2] is network_eeros:
+            # served from the cache, nothing changed but maybe the network name
+            self.labels[network["url"]] = (network_label_values(network), self.labels[network["url"]][1])
+            return []
+
+        states = {client["mac"]: client_state(client) for client in clients}
+        eeros = {eero["url"].split('/')[3]: (eero["location"], eero["heartbeat_ok"]) for eero in (network_eeros if network_eeros is not None else details["eeros"]["data"])}
+
+        self.labels[network["url"]] = (network_label_values(network), {eero_id: eero_name for eero_id, (eero_name, _) in eeros.items()})
+        for counts, events in ((self.client_events, CLIENT_EVENTS), (self.heartbeat_changes, HEARTBEAT_CHANGES)):
+            network_counts = counts.setdefault(network["url"], {})
+            # drop eeros that have left the network
+            for key in list(network_counts):
+                if key[1] not in eeros:
+                    del network_counts[key]
+            # every eero gets every counter, so rate() works from the first event
+            for eero_id in eeros:
+                for event in events:
+                    network_counts.setdefault((event, eero_id), 0)
+
+        events = []
+        if previous is not None:
+            events.extend(self.diff_clients(network, previous[3], states, now))
+            events.extend(self.diff_eeros(network, previous[4], eeros, now))
+        self.previous[network["url"]] = (details, clients, network_eeros, states, eeros)
+        return events
+
+    def forget(self, networks):
+        """Drops the state and counts of networks that have left the account"""
+        urls = set(network["url"] for network in networks)
+        for url in list(self.previous):
+            if url not in urls:
+                del self.previous[url]
+                self.client_events.pop(url, None)
+                self.heartbeat_changes.pop(url, None)
+                self.labels.pop(url, None)
+
+    def event(self, event, network, now, **details):
+        labels = network_label_values(network)
+        record = {"time": now, "event": event, "network_id": labels[0], "network_name": labels[1]}
+        if self.account is not None:
+            record["account"] = self.account
+        record.update(details)
+        return record
+
+    def count(self, counts, event, network, eero_id):
+        # only eeros on the network are counted, a client can still name one that has just left
+        key = (event, eero_id)
+        if key in counts[network["url"]]:
+            counts[network["url"]][key] += 1
+
+    def diff_clients(self, network, previous, current, now):
+        for mac in list(current) + [mac for mac in previous if mac not in current]:
+            before = previous.get(mac)
+            after = current.get(mac)
+            was_connected = before is not None and before.connected
+            is_connected = after is not None and after.connected
+            if not was_connected and not is_connected:
+                continue
+
+            state = after if is_connected else before
+            details = {"client_mac": mac, "client_hostname": state.hostname, "client_display_name": state.display_name,
+                       "eero_id": state.eero_id, "eero_name": state.eero_name, "band": state.band, "channel": state.channel}
+            if not was_connected:
+                self.count(self.client_events, "join", network, after.eero_id)
+                yield self.event("join", network, now, **details)
+            elif not is_connected:
+                self.count(self.client_events, "leave", network, before.eero_id)
+                yield self.event("leave", network, now, **details)
+            elif before.eero_id != after.eero_id:
+                # band and channel usually change with the eero, the roam event carries both
+                self.count(self.client_events, "roam_out", network, before.eero_id)
+                self.count(self.client_events, "roam_in", network, after.eero_id)
+                yield self.event("roam", network, now, from_eero_id = before.eero_id, from_eero_name = before.eero_name,
+                                 from_band = before.band, from_channel = before.channel, **details)
+            else:
+                if before.band != after.band:
+                    self.count(self.client_events, "band_change", network, after.eero_id)
+                    yield self.event("band_change", network, now, from_band = before.band, **details)
+                if before.channel != after.channel and before.channel is not None and after.channel is not None:
+                    self.count(self.client_events, "channel_change", network, after.eero_id)
+                    yield self.event("channel_change", network, now, from_channel = before.channel, **details)
+
+    def diff_eeros(self, network, previous, current, now):
+        for eero_id, (eero_name, heartbeat_ok) in current.items():
+            if eero_id in previous and previous[eero_id][1] != heartbeat_ok:
+                change = "restored" if heartbeat_ok else "lost"
+                self.count(self.heartbeat_changes, change, network, eero_id)
+                yield self.event("heartbeat_" + change, network, now, eero_id = eero_id, eero_name = eero_name, heartbeat_ok = heartbeat_ok)
+
+    def families(self):
+        label_names = EERO_LABELS + self.account_labels
+        client_events = CounterMetricFamily('eero_network_eero_client_events', 'Clients joining, leaving, roaming to (roam_in) or from (roam_out) '
+                                            'the eero, or changing band or channel, seen between refreshes', labels = ['event'] + label_names)
+        heartbeat_changes = CounterMetricFamily('eero_network_eero_heartbeat_changes', 'Times the eero heartbeat was lost or restored between refreshes',
+                                                labels = ['change'] + label_names)
+        for counts, family in ((self.client_events, client_events), (self.heartbeat_changes, heartbeat_changes)):
+            for url, network_counts in counts.items():
+                network_values, names = self.labels[url]
+                for (event, eero_id), count in network_counts.items():
+                    family.add_metric([event, eero_id, names[eero_id]] + network_values + self.account_values, count)
+        return [client_events, heartbeat_changes]
+
+
+class FileSink(object):
+    """Appends the events of every refresh to a file as JSON lines, reopening it each time so it can be rotated"""
+    def __init__(self, path):
+        self.path = path
+        # pollers of several accounts share a sink
+        self.lock = threading.Lock()
+
+    def __call__(self, poller):
+        if not poller.events:
+            return
+        try:
+            with self.lock, open(self.path, 'a') as stream:
+                for event in poller.events:
+                    stream.write(json.dumps(event, sort_keys = True) + "\n")
+        except Exception as ex:
+            EVENT_SINK_ERRORS.labels("file").inc(len(poller.events))
+            log.warning("writing events to %s failed: %r", self.path, ex)
+
+
+class WebhookSink(object):
+    """POSTs the events of every refresh as a JSON array, from a background thread so a slow endpoint can't hold up refreshes"""
+    def __init__(self, url, timeout = 10):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        # one at a time, so events arrive in order
+        self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "eero-events")
+
+    def __call__(self, poller):
+        if poller.events:
+            try:
+                self.executor.submit(self.post, list(poller.events))
+            except Exception as ex:
+                EVENT_SINK_ERRORS.labels("webhook").inc(len(poller.events))
+                log.warning("queueing %d events for %s failed: %r", len(poller.events), self.url, ex)
+
+    def post(self, events):
+        try:
+            self.session.post(self.url, json = events, timeout = self.timeout).raise_for_status()
+        except Exception as ex:
+            EVENT_SINK_ERRORS.labels("webhook").inc(len(events))
+            log.warning("posting %d events to %s failed: %r", len(events), self.url, ex)
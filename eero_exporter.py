@@ -1,254 +1,594 @@
 #!/usr/bin/env python
 from argparse import ArgumentParser
-from prometheus_client import start_http_server
-from prometheus_client.core import GaugeMetricFamily, InfoMetricFamily, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from prometheus_client.exposition import ThreadingWSGIServer, choose_encoder, gzip_accepted
+from eero.exception import ClientException
 import eero as eero_api
+import copy
+import logging
+import os
 import time
+import change_events
 import cookie_store
-from datetime import datetime
+import metric_schema
+import transport
+from metric_schema import network_label_values
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+from yaml import load, SafeLoader
+import threading
+import zlib
+
+# An immutable view of everything the poller fetched on one refresh, phases maps phase name to seconds spent in it
+Snapshot = namedtuple('Snapshot', ['families', 'timestamp', 'duration', 'phases'])
+
+# What a scrape reports about one poller, read under its lock
+PollerState = namedtuple('PollerState', ['poller', 'snapshot', 'success', 'failures', 'backoff'])
+
+# An eero account to export, name is None when a single account is exported without an account label
+Account = namedtuple('Account', ['name', 'session'])
+
+# Endpoints fetched for every network on the account
+NETWORK_ENDPOINTS = ["networks", "devices"]
+# Also fetched when networks is cached for longer than devices, so eero status and heartbeats keep the fast tier
+EERO_ENDPOINT = "eeros"
+
+log = logging.getLogger("eero_exporter")
+
+# Upper bound of the refresh backoff factor
+MAX_BACKOFF = 16
+
+
+def load_accounts(path):
+    """Reads the accounts to export from a yaml config file such as
+
+    accounts:
+      - name: home
+        session: home.yml
+      - name: cabin
+        session: cabin.yml
+
+    Session stores are relative to the config file.
+    """
+    with open(path, 'r') as stream:
+        config = load(stream, Loader=SafeLoader)
+    accounts = []
+    for account in config['accounts']:
+        accounts.append(Account(str(account['name']), os.path.join(os.path.dirname(os.path.abspath(path)), account['session'])))
+    names = [account.name for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError("account names in " + path + " must be unique")
+    return accounts
+
+
+def serialize_session_refresh(api):
+    """Makes requests of api that find the session expired share one login/refresh
+
+    Upstream Eero.refreshed refreshes the session for every request that gets error.session.refresh, so concurrent
+    fetches each posted a refresh and rewrote the session store, keeping whichever token came back last. Now one
+    refresh runs at a time, and a request whose session was already refreshed by another one just retries.
+    """
+    lock = threading.Lock()
+
+    def refreshed(func):
+        # the cookie func is about to send
+        cookie = api.session.cookie
+        try:
+            return func()
+        except ClientException as ex:
+            if ex.status != 401 or ex.error_message != 'error.session.refresh':
+                raise
+        with lock:
+            if api.session.cookie == cookie:
+                api.login_refresh()
+        return func()
+    api.refreshed = refreshed
+    return api
+
+
+class Poller(object):
+    def __init__(self, api, interval, concurrency = 8, ttls = None, builder_options = None, account = None, executor = None):
+        self.api = api
+        self.interval = interval
+        # samples of this poller carry an account label when several accounts are exported
+        self.account = account
+        self.account_labels = ["account"] if account is not None else []
+        self.account_values = [account] if account is not None else []
+        # keyword arguments for metric_schema.FamilyBuilder, controlling per-client cardinality
+        self.builder_options = builder_options if builder_options is not None else {}
+        # endpoint -> seconds its data is reused for, endpoints not listed are fetched on every refresh
+        self.ttls = ttls if ttls is not None else {}
+        self.endpoints = list(NETWORK_ENDPOINTS)
+        if self.ttls.get("networks", 0) > self.ttls.get("devices", 0):
+            self.endpoints.append(EERO_ENDPOINT)
+        # (endpoint, url) -> (fetch time, data), only touched from the polling thread
+        self.cache = {}
+        self.snapshot = None
+        # multiplies interval while the eero api is rate limiting us
+        self.backoff = 1
+        self.last_refresh_success = False
+        self.refresh_failures = 0
+        # (network label values, endpoint) -> count of failed fetches
+        self.network_errors = defaultdict(int)
+        self.lock = threading.Lock()
+        # diffs each refresh against the last, events holds what changed in the latest snapshot
+        self.changes = change_events.ChangeTracker(account)
+        self.events = []
+        # called with the poller after every new snapshot, from the polling thread
+        self.listeners = []
+        # shared between accounts, so concurrency bounds the requests in flight for the whole process
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers = concurrency, thread_name_prefix = "eero-fetch")
+
+    def network_labels(self, network):
+        return network_label_values(network) + self.account_values
+
+    def parse_seconds(self):
+        return getattr(getattr(self.api, "client", None), "parse_seconds", 0)
+
+    def rate_limited(self):
+        client = getattr(self.api, "client", None)
+        return client.take_rate_limited() if hasattr(client, "take_rate_limited") else False
+
+    def refresh(self):
+        start = time.time()
+        parse_start = self.parse_seconds()
+        try:
+            now = time.time()
+            networks = self.fetch_account(now)['networks']['data']
+            results = self.fetch_networks(networks, now)
+            fetched = time.time()
+            families, events = self.build_families(networks, results, fetched)
+        except Exception as ex:
+            with self.lock:
+                self.last_refresh_success = False
+                self.refresh_failures += 1
+            log.warning("%srefresh failed: %r", self.log_prefix(), ex)
+            return
+        end = time.time()
+
+        phases = {"fetch": fetched - start, "parse": self.parse_seconds() - parse_start, "build": end - fetched}
+        family_samples = GaugeMetricFamily('eero_exporter_family_samples', 'Number of samples of each metric family in the snapshot being served',
+                                           labels = ['family'] + self.account_labels)
+        for family in families:
+            family_samples.add_metric([family.name] + self.account_values, len(family.samples))
+
+        with self.lock:
+            self.snapshot = Snapshot(families + (family_samples,), end, end - start, phases)
+            self.last_refresh_success = True
+        self.events = events
+        log.debug("%srefreshed %d networks in %.3fs, %d change events", self.log_prefix(), len(networks), end - start, len(events))
+        for listener in self.listeners:
+            # a failing sink or render must not end the polling thread
+            try:
+                listener(self)
+            except Exception as ex:
+                log.warning("%slistener %r failed: %r", self.log_prefix(), listener, ex)
+
+    def log_prefix(self):
+        return "account " + self.account + ": " if self.account is not None else ""
+
+    def run(self):
+        while True:
+            start = time.time()
+            self.refresh()
+            # double the interval while we are rate limited, and ease back once we are not
+            rate_limited = self.rate_limited()
+            with self.lock:
+                if rate_limited:
+                    self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+                else:
+                    self.backoff = max(self.backoff / 2, 1)
+            if rate_limited:
+                log.warning("%seero api is rate limiting, refreshing every %ds", self.log_prefix(), self.interval * self.backoff)
+            time.sleep(max(0, self.interval * self.backoff - (time.time() - start)))
+
+    def expired(self, endpoint, url, now):
+        entry = self.cache.get((endpoint, url))
+        # half an interval of slack so a ttl that is a multiple of the interval is not pushed back a whole tick by jitter
+        return entry is None or now - entry[0] >= self.ttls.get(endpoint, 0) - self.interval / 2
+
+    def fetch_account(self, now):
+        if self.expired("account", None, now):
+            log.debug("%sfetching account", self.log_prefix())
+            try:
+                self.cache[("account", None)] = (time.time(), self.api.account())
+            except Exception as ex:
+                # networks can still be refreshed from the last account we saw
+                if ("account", None) not in self.cache:
+                    raise
+                log.warning("%sfetching account failed, reusing cached account: %r", self.log_prefix(), ex)
+        return self.cache[("account", None)][1]
+
+    def fetch_networks(self, networks, now):
+        """Fetches the expired endpoints of every network concurrently, returning (success, {endpoint: data}) per network.
+
+        Endpoints that are still fresh, or that failed but were fetched before, are served from the cache.
+        A network that has never been fetched successfully maps to None so the rest of the account can still be exported.
+        """
+        futures = []
+        for network in networks:
+            futures.append({endpoint: self.executor.submit(getattr(self.api, endpoint), network['url'])
+                            for endpoint in self.endpoints if self.expired(endpoint, network['url'], now)})
+
+        results = []
+        for network, network_futures in zip(networks, futures):
+            success = True
+            for endpoint, future in network_futures.items():
+                try:
+                    self.cache[(endpoint, network['url'])] = (time.time(), future.result())
+                except Exception as ex:
+                    log.warning("%sfetching %s for network %s failed: %r", self.log_prefix(), endpoint, network["name"], ex)
+                    with self.lock:
+                        self.network_errors[(tuple(self.network_labels(network)), endpoint)] += 1
+                    success = False
+
+            result = {}
+            for endpoint in self.endpoints:
+                if (endpoint, network['url']) in self.cache:
+                    result[endpoint] = self.cache[(endpoint, network['url'])]
+            results.append((success, result if len(result) == len(self.endpoints) else None))
+
+        # forget networks that have left the account, and the error counts of those that left or were renamed
+        urls = set(network['url'] for network in networks)
+        for endpoint, url in list(self.cache):
+            if url is not None and url not in urls:
+                del self.cache[(endpoint, url)]
+        labels = set(tuple(self.network_labels(network)) for network in networks)
+        with self.lock:
+            for key in list(self.network_errors):
+                if key[0] not in labels:
+                    del self.network_errors[key]
+        return results
+
+    def build_families(self, networks, results, now):
+        """Families and change events of this refresh
+
+        Each network is diffed and built on its own, so one whose data can't be read is left out of the schema families
+        and counted as a "parse" error while the rest of the account is still exported.
+        """
+        builder = metric_schema.FamilyBuilder(account = self.account, **self.builder_options)
+        events = []
+        built = []
+        for network, (success, result) in zip(networks, results):
+            if result is not None:
+                try:
+                    eeros = result[EERO_ENDPOINT][1] if EERO_ENDPOINT in result else None
+                    network_events = self.changes.update(network, result["networks"][1], result["devices"][1], now, eeros)
+                    builder.add_network(network, result["networks"][1], result["devices"][1], eeros)
+                    events.extend(network_events)
+                except Exception as ex:
+                    log.warning("%sbuilding network %s failed: %r", self.log_prefix(), network["name"], ex)
+                    with self.lock:
+                        self.network_errors[(tuple(self.network_labels(network)), "parse")] += 1
+                    success = False
+            built.append((network, success, result))
+        self.changes.forget(networks)
+
+        label_names = metric_schema.NETWORK_LABELS + self.account_labels
+        refresh_success = GaugeMetricFamily('eero_network_refresh_success', '1 if all data for the Eero Network was fetched and read on the last refresh',
+                                            labels = label_names)
+        refresh_errors = CounterMetricFamily('eero_network_refresh_errors',
+                                             'Number of failed eero api requests for the Eero Network, or of refreshes whose data could not be read (endpoint="parse")',
+                                             labels = ['endpoint'] + label_names)
+        data_timestamp = GaugeMetricFamily('eero_network_data_timestamp_seconds', 'Time in Epoch when the cached data of each endpoint was fetched', labels = ['endpoint'] + label_names)
+        for network, success, result in built:
+            refresh_success.add_metric(self.network_labels(network), 1 if success else 0)
+            if result is not None:
+                for endpoint in self.endpoints:
+                    data_timestamp.add_metric([endpoint] + self.network_labels(network), result[endpoint][0])
+        with self.lock:
+            for (label_values, endpoint), count in self.network_errors.items():
+                refresh_errors.add_metric([endpoint] + list(label_values), count)
+
+        families = (refresh_success, refresh_errors, data_timestamp) + tuple(builder.families.values()) + tuple(self.changes.families())
+        return families, events
+
+
+def merge_families(family_lists):
+    """Combines families of the same name from several snapshots, without touching the snapshots"""
+    if len(family_lists) == 1:
+        return family_lists[0]
+    merged = {}
+    copied = set()
+    for families in family_lists:
+        for family in families:
+            if family.name not in merged:
+                merged[family.name] = family
+                continue
+            if family.name not in copied:
+                merged[family.name] = copy.copy(merged[family.name])
+                merged[family.name].samples = list(merged[family.name].samples)
+                copied.add(family.name)
+            merged[family.name].samples.extend(family.samples)
+    return list(merged.values())
+
+
+def poller_states(pollers):
+    """PollerState of every poller, read consistently per poller"""
+    states = []
+    for poller in pollers:
+        with poller.lock:
+            states.append(PollerState(poller, poller.snapshot, poller.last_refresh_success, poller.refresh_failures, poller.backoff))
+    return states
 
-class JsonCollector(object):
-    def collect(self):
-        print("connecting to eero api")
-        account = eero_api_session.account()
-        print("connected to eero api")
-        for network in account['networks']['data']:
-
-            metrics = {}
-            label_names = ['network_id', 'network_name', 'network_display_name']
-            eero_features = ["upnp", "ipv6", "thread", "sqm", "band_steering", "wpa3", "amazon_account_linked", "alexa_skill", "amazon_device_nickname", "backup_internet_enabled", "power_saving"]
-            client_details_list = ["manufacturer"]
-
-            # Creating Metric Families
-
-            # Network-specific metrics
-            metrics["ssid"] = InfoMetricFamily('eero_network_ssid', 'Current Eero Network SSID and Nickname, will always output 1 if detected', labels = label_names)
-            metrics["supported_feature"] = GaugeMetricFamily('eero_network_feature_supported', 'If the Eero Network can support feature, output 1 if supported', labels = ['feature'] + label_names)
-            metrics["wan_ip"] = InfoMetricFamily('eero_network_wan_ip', 'WAN IP for the Eero Network, should be your Public IP if you are in a double nat', labels = label_names)
-            metrics["connection_mode"] = InfoMetricFamily('eero_network_connection', 'What the Eero Network is connected to', labels = label_names)
-            metrics["dhcp"] = InfoMetricFamily('eero_network_dhcp', 'Configured DHCP Settings for the Eero Network', labels = label_names)
-            metrics["dns"] = InfoMetricFamily('eero_network_dns', 'Configured DNS Settings for the Eero Network', labels = label_names)
-            for feature in eero_features:
-                metrics[feature] = GaugeMetricFamily('eero_network_' + feature, 'If ' + feature + ' is enabled, output 1 if enabled', labels=label_names)
-            metrics["client_count"] = GaugeMetricFamily('eero_network_client_count', 'Total amount of clients connected to network', labels = label_names)
-            metrics["upload_bandwidth"] = GaugeMetricFamily('eero_network_upload_bandwidth', 'Upload Speed in Bits per Second', labels = label_names, unit = "bps")
-            metrics["download_bandwidth"] = GaugeMetricFamily('eero_network_download_bandwidth', 'Upload Speed in Bits per Second', labels = label_names, unit = "bps")
-            metrics["bandwidth_last_test"] = GaugeMetricFamily('eero_network_bandwidth_last_test', 'Last time that bandwidth test was performed', labels = label_names)
-            metrics["update_version"] = InfoMetricFamily('eero_network_update_version', 'Current Eero version of network', labels = label_names)
-            metrics["has_update"] = GaugeMetricFamily('eero_network_update_available', 'Eero network has available update, 1 if true', labels = label_names)
-            metrics["last_update"] = GaugeMetricFamily('eero_network_update_date', 'Datetime of last Eero update', labels = label_names)
-            metrics["internet_health"] = GaugeMetricFamily('eero_network_internet_up', '1 if Eero reporting successful internet connection', labels = label_names)
-            metrics["eero_health"] = GaugeMetricFamily('eero_network_up', '1 if Eero network reporting healthy', labels = label_names)
-            metrics["public_ip"] = InfoMetricFamily('eero_network_public_ip', 'Public IP address of Eero network', labels = label_names)
-            metrics["double_nat"] = GaugeMetricFamily('eero_network_double_nat', '1 if Eero detects that it detects it is behind an existing NAT', labels = label_names)
-            metrics["premium_dns_enabled"] = GaugeMetricFamily('eero_network_premium_dns_enabled', '1 if Eero Secure Plus DNS settings are enabled', labels = label_names)
-            metrics["premium_dns_policies"] = InfoMetricFamily('eero_network_premium_dns_policies', 'Premium DNS policies enabled on network', labels = label_names)
-            metrics["homekit_enabled"] = GaugeMetricFamily('eero_network_homekit_enabled', '1 if Eero connected to Apple Homekit', labels = label_names)
-            metrics["homekit_managed_network"] = GaugeMetricFamily('eero_network_homekit_managed_network_enabled', '1 if Homekit Managed Network is enabled on Eero Routers', labels = label_names)
-            metrics["guest_ssid_enabled"] = GaugeMetricFamily('eero_network_guest_ssid_enabled', '1 if Guest Network is enabled', labels = label_names)
-            metrics["guest_ssid"] = InfoMetricFamily('eero_network_guest_ssid', 'SSID of Guest Network', labels = label_names)
-            metrics["last_reboot"] = GaugeMetricFamily('eero_network_last_restart', 'Time of last full network restart', labels = label_names)
-            metrics["ddns_enabled"] = GaugeMetricFamily('eero_network_ddns_enabled', '1 if Dynamic DNS is enabled', labels = label_names)
-            metrics["ddns_subdomain"] = InfoMetricFamily('eero_network_ddns_subdomain', 'Unique domain with public IP as A record', labels = label_names)
-
-            # Eero-specific metrics
-            eero_label_names = ["eero_id", "eero_name"] + label_names
-            metrics["eero_count"] = GaugeMetricFamily('eero_network_eero_count', 'Amount of Eeros connected to network', labels=label_names)
-            metrics["eero_model"] = InfoMetricFamily('eero_network_eero_model', 'Eero Model Name and Number', labels = eero_label_names)
-            metrics["eero_mac"] = InfoMetricFamily('eero_network_eero_mac', 'Eero Router MAC Addresses', labels = eero_label_names)
-            metrics["eero_mesh_connection_quality"] = GaugeMetricFamily('eero_network_eero_mesh_connection_quality', 'Connection quality of Eeros to mesh network as a percentage, gateway Eero will always be 100%', labels = eero_label_names)
-            metrics['eero_mesh_connection_type'] = InfoMetricFamily('eero_network_eero_mesh_connection_type', 'If the connection type is either Wired or Wireless, Gateway Eero will always be WIRED', labels = eero_label_names)
-            metrics['eero_gateway'] = GaugeMetricFamily('eero_network_eero_gateway', 'Outputs 1 if Gateway Eero', labels = eero_label_names)
-            metrics['eero_status'] = GaugeMetricFamily('eero_network_eero_status', 'Outputs 1 if Eero is in a Good (green) Status', labels = eero_label_names)
-            metrics["eero_client_count"] = GaugeMetricFamily('eero_network_eero_client_count', 'The amount of clients connected to Eero Router', labels = eero_label_names)
-            metrics['eero_heartbeat'] = GaugeMetricFamily('eero_network_eero_heartbeat', '1 if Eero is passing heartbeat checks', labels = eero_label_names)
-            metrics['eero_last_heartbeat'] = GaugeMetricFamily('eero_network_eero_last_heartbeat', 'Date and Time in Epoch of last successful Heartbeat', labels = eero_label_names)
-            metrics['eero_wifi'] = GaugeMetricFamily('eero_network_eero_wifi_enabled', 'If wireless connectivity is enabled on the Eero, 1 if enabled', labels = eero_label_names)
-            metrics['eero_wifi_bands'] = InfoMetricFamily('eero_network_eero_wifi_bands', 'Enabled Wireless Bands of Eero', labels = eero_label_names)
-            metrics["eero_ipv4"] = InfoMetricFamily('eero_network_eero_ipv4', 'Eero Router IPv4 Address', labels = eero_label_names)
-            metrics["eero_ipv6"] = InfoMetricFamily('eero_network_eero_ipv6', 'Eero Router IPv6 Address', labels = eero_label_names)
-            metrics["eero_version"] = InfoMetricFamily('eero_network_eero_version', 'Current OS version of Eero', labels = eero_label_names)
-            metrics["eero_last_reboot"] = GaugeMetricFamily('eero_network_eero_last_restart', 'Last restart of eero device, value does not update with full network restarts (see eero_network_last_restart)', labels = eero_label_names)
-
-            # Client-specific metrics
-            client_label_names = ["client_mac", "client_hostname", "client_display_name"] + eero_label_names
-            metrics["client_details"] = InfoMetricFamily('eero_network_client_details', "miscellaneous collected details of connected clients", labels = client_label_names)
-            metrics["client_ip"] = InfoMetricFamily('eero_network_client_ip', 'ip addresses of connected clients', labels = client_label_names)
-            metrics["client_connected"] = GaugeMetricFamily('eero_network_client_connected', 'if client is currently connected to the network', labels = client_label_names)
-            metrics["client_connection_type"] = InfoMetricFamily('eero_network_client_connection_type', 'how the client is connected to the network, generally either wired or wireless', labels = client_label_names)
-            metrics["client_last_active"] = GaugeMetricFamily('eero_network_client_last_active', 'time when client was last active', labels = client_label_names)
-            metrics["client_connection_strength"] = GaugeMetricFamily('eero_network_client_connection_strength', 'connection strength in dBm', labels = client_label_names, unit = "dBm")
-            metrics["client_connection_quality"] = GaugeMetricFamily('eero_network_client_connection_quality', 'connection quality as a percentage, 1 is best quality. wired connections will not appear', labels = client_label_names)
-            metrics["client_connection_wireless_frequency"] = GaugeMetricFamily('eero_network_client_connection_frequency', 'wireless frequency client is connected via', labels = client_label_names)
-            metrics["client_rx_bandwidth"] = GaugeMetricFamily('eero_network_client_rx_bandwidth', 'client receive bandwidth in bits per second', labels = client_label_names, unit = "bps")
-            metrics["client_tx_bandwidth"] = GaugeMetricFamily('eero_network_client_tx_bandwidth', 'client transmit bandwidth in bits per second', labels = client_label_names, unit = "bps")
-            metrics["client_rx_connection_details"] = InfoMetricFamily('eero_network_client_connection_details', 'miscellaneous collected client receive connection details', labels = client_label_names)
-            metrics["client_tx_connection_details"] = InfoMetricFamily('eero_network_client_connection_details', 'miscellaneous collected client transmit connection details', labels = client_label_names)
-            metrics["client_connection_auth_type"] = InfoMetricFamily('eero_network_client_connection_auth', 'authentication method of the wireless device', labels = client_label_names)
-            metrics["client_connection_channel"] = GaugeMetricFamily('eero_network_client_connection_channel', 'wireless channel that client is connected via', labels = client_label_names)
-            metrics["client_wired_bandwidth"] = GaugeMetricFamily('eero_network_client_wired_bandwidth', 'bandwidth of wired client in bits per second', labels = client_label_names, unit = "bps")
-            metrics["client_blacklisted"] = GaugeMetricFamily('eero_network_client_blacklisted', 'if client is blocked from connecting to the network, 1 if true', labels = client_label_names)
-            metrics["client_paused"] = GaugeMetricFamily('eero_network_client_paused', 'if client is temporarily blocked from connecting to the network, 1 if true', labels = client_label_names)
-            metrics["client_guest"] = GaugeMetricFamily('eero_network_client_guest', '1 if client is connected to guest network', labels = client_label_names)
-            metrics["client_homekit"] = GaugeMetricFamily('eero_network_client_homekit', '1 if client is registered with homekit secure router network', labels = ["protection_mode"] + client_label_names)
-
-            network_id = network['url'].split('/')[3]
-
-            network_details = eero_api_session.networks(network['url'])
-            network_clients = eero_api_session.devices(network['url'])
-
-            # Global Labels and Values
-            label_values = [network_id, network["name"], network["nickname_label"] if network["nickname_label"] is not None else network["name"] ]
-
-            metrics["ssid"].add_metric(label_values, value = {"ssid" : network["name"]})
-
-            for feature in network_details["capabilities"]:
-                metrics["supported_feature"].add_metric([feature] + label_values, 1 if network_details["capabilities"][feature]["capable"] else 0)
-
-            metrics["wan_ip"].add_metric(label_values, value = {"wan_ip" : network_details["wan_ip"]})
-
-            metrics["connection_mode"].add_metric(label_values, value = {"connection" : network_details["connection"]["mode"]})
-
-            metrics["dhcp"].add_metric(label_values, value = {"dhcp_mode" : network_details["dhcp"]["mode"]})
-
-            if network_details["dhcp"]["mode"] != "automatic":
-                metrics["dhcp"].add_metric(label_values, value = {"dhcp_subnet_mask" : network_details["dhcp"]["custom"]["subnet_mask"]})
-                metrics["dhcp"].add_metric(label_values, value = {"dhcp_subnet_ip" : network_details["dhcp"]["custom"]["subnet_ip"]})
-
-            metrics["dns"].add_metric(label_values, value = {"dns_mode" : network_details["dns"]["mode"]})
-            metrics["dns"].add_metric(label_values, value = {"dns_caching" : "true" if network_details["dns"]["caching"] else "false"})
-            metrics["dns"].add_metric(label_values, value = {"dns_server" : ", ".join(network_details["dns"]["custom"]["ips"] if network_details["dns"]["mode"] == "custom" else network_details["dns"]["parent"]["ips"])})
-
-            for feature in eero_features:
-                metrics[feature].add_metric(label_values, 1 if network_details[feature] else 0)
-
-            metrics["client_count"].add_metric(label_values, network_details["clients"]["count"])
-            
-            # converting to bits per second per Prometheus unit standards
-            metrics["upload_bandwidth"].add_metric(label_values, network_details["speed"]["up"]["value"] * 1000000)
-            metrics["download_bandwidth"].add_metric(label_values, network_details["speed"]["down"]["value"] * 1000000)
-            metrics["bandwidth_last_test"].add_metric(label_values, datetime.timestamp(datetime.strptime(network_details["speed"]["date"], "%Y-%m-%dT%H:%M:%SZ")))
-
-            metrics["update_version"].add_metric(label_values, value = {"version" : network_details["updates"]["target_firmware"]})
-            metrics["has_update"].add_metric(label_values, 1 if network_details["updates"]["has_update"] else 0)
-            metrics["last_update"].add_metric(label_values, datetime.timestamp(datetime.strptime(network_details["updates"]["last_update_started"], "%Y-%m-%dT%H:%M:%S.%fZ")))
-
-            metrics["internet_health"].add_metric(label_values, 1 if network_details["health"]["internet"]["status"] == "connected" else 0)
-            metrics["eero_health"].add_metric(label_values, 1 if network_details["health"]["eero_network"]["status"] == "connected" else 0)
-
-            metrics["public_ip"].add_metric(label_values, value = {"ip" : network_details["ip_settings"]["public_ip"]})
-
-            metrics["double_nat"].add_metric(label_values, 1 if network_details["ip_settings"]["double_nat"] else 0)
-
-            metrics["premium_dns_enabled"].add_metric(label_values, 1 if network_details["premium_dns"]["dns_policies_enabled"] else 0)
-            for policy in network_details["premium_dns"]["dns_policies"]:
-                if network_details["premium_dns"]["dns_policies"][policy]:
-                    metrics["premium_dns_policies"].add_metric(label_values, value = {"policy" : policy})
-
-            metrics["last_reboot"].add_metric(label_values, datetime.timestamp(datetime.strptime(network_details["last_reboot"], "%Y-%m-%dT%H:%M:%S.%fZ")) if network_details["last_reboot"] is not None else 0)
-
-            if network_details["homekit"] is not None:
-                metrics["homekit_enabled"].add_metric(label_values, 1 if network_details["homekit"]["enabled"] else 0)
-                metrics["homekit_managed_network"].add_metric(label_values, 1 if network_details["homekit"]["managedNetworkEnabled"] else 0)
-
-            metrics["guest_ssid"].add_metric(label_values, value = {"ssid" : network_details["guest_network"]["name"]})
-            metrics["guest_ssid_enabled"].add_metric(label_values, 1 if network_details["guest_network"]["enabled"] else 0)
-
-            metrics["ddns_enabled"].add_metric(label_values, 1 if network_details["ddns"]["enabled"] else 0)
-            metrics["ddns_subdomain"].add_metric(label_values, value = {"domain" : network_details["ddns"]["subdomain"]})
-
-            metrics["eero_count"].add_metric(label_values, network_details["eeros"]["count"])
-
-            for eero in network_details["eeros"]["data"]:
-                eero_id = eero['url'].split('/')[3]
-                eero_name = eero["location"]
-                eero_label_values = [eero_id, eero_name] + label_values
-                metrics["eero_model"].add_metric(eero_label_values, value = {"model" : eero["model"]})
-                metrics["eero_model"].add_metric(eero_label_values, value = {"model_number" : eero["model_number"]})
-                metrics["eero_mesh_connection_quality"].add_metric(eero_label_values, eero["mesh_quality_bars"]/5 if eero["mesh_quality_bars"] is not None else 0)
-                metrics["eero_mesh_connection_type"].add_metric(eero_label_values, value = {"connection" : eero["connection_type"] if eero["connection_type"] is not None else "DISCONNECTED"})
-                metrics["eero_gateway"].add_metric(eero_label_values, 1 if eero["gateway"] else 0)
-                metrics["eero_status"].add_metric(eero_label_values, 1 if eero["status"] == "green" else 0)
-                metrics["eero_client_count"].add_metric(eero_label_values, eero["connected_clients_count"])
-                metrics["eero_heartbeat"].add_metric(eero_label_values, 1 if eero["heartbeat_ok"] else 0)
-                metrics["eero_last_heartbeat"].add_metric(eero_label_values, datetime.timestamp(datetime.strptime(eero["last_heartbeat"], "%Y-%m-%dT%H:%M:%S.%fZ")))
-                metrics['eero_wifi'].add_metric(eero_label_values, 1 if eero["provides_wifi"] else 0)
-                # foreach instead of join?
-                metrics["eero_wifi_bands"].add_metric(eero_label_values, value = {"band" : ", ".join(eero["bands"])})
-                metrics["eero_mac"].add_metric(eero_label_values, value = {"mac_address" : ", ".join(eero["ethernet_addresses"] + eero["wifi_bssids"])})
-                metrics["eero_ipv4"].add_metric(eero_label_values, value = {"ipv4_address" : eero["ip_address"]})
-                ipv6_addresses = []
-                for ipv6 in eero["ipv6_addresses"]:
-                    ipv6_addresses.append(ipv6["address"])
-                metrics["eero_ipv6"].add_metric(eero_label_values, value = {"ipv6_address" : ", ".join(ipv6_addresses)})
-                metrics["eero_version"].add_metric(eero_label_values, value = {"version" : eero["os"]})
-                metrics["eero_last_reboot"].add_metric(eero_label_values, datetime.timestamp(datetime.strptime(eero["last_reboot"], "%Y-%m-%dT%H:%M:%S.%fZ")) if eero["last_reboot"] is not None else 0)
-
-            for client in network_clients:
-                client_label_values = [client["mac"], client["hostname"] if client["hostname"] is not None else "", client["display_name"] if client["display_name"] is not None else "", client["source"]["url"].split('/')[3], client["source"]["location"]] + label_values
-                for detail in client_details_list:
-                    if client[detail] is not None:
-                        metrics["client_details"].add_metric(client_label_values, value = {detail : client[detail]})
 
-                for ip in client["ips"]:
-                    metrics["client_ip"].add_metric(client_label_values, value = {"ip" : ip})
-
-                metrics["client_connected"].add_metric(client_label_values, 1 if client["connected"] else 0)
-                metrics["client_connection_type"].add_metric(client_label_values, value = {"connection" : client["connection_type"]})
-                metrics["client_last_active"].add_metric(client_label_values, datetime.timestamp(datetime.strptime(client["last_active"], "%Y-%m-%dT%H:%M:%S.%fZ")))
+class JsonCollector(object):
+    """Serves the snapshots of pollers and metadata about how stale they are
 
-                if client["wireless"]:
-                    metrics["client_connection_strength"].add_metric(client_label_values, client["connectivity"]["signal"][:-4])
-                    metrics["client_connection_quality"].add_metric(client_label_values, client["connectivity"]["score"])
-                    metrics["client_connection_wireless_frequency"].add_metric(client_label_values, client["connectivity"]["frequency"])
+    When the snapshots are served pre-rendered by a RenderCache, pass it as cache so only the metadata is collected.
+    """
+    def __init__(self, pollers, cache = None):
+        self.pollers = pollers
+        self.cache = cache
+        self.serialize_seconds = None
 
-                    metrics["client_rx_bandwidth"].add_metric(client_label_values, client["connectivity"]["rx_rate_info"]["rate_bps"] if client["connectivity"]["rx_rate_info"]["rate_bps"] is not None else 0)
-                    metrics["client_tx_bandwidth"].add_metric(client_label_values, client["connectivity"]["tx_rate_info"]["rate_bps"] if client["connectivity"]["tx_rate_info"]["rate_bps"] is not None else 0)
+    def collect(self):
+        states = poller_states(self.pollers)
+
+        if self.cache is None:
+            # families are rendered as they are yielded, so this times serializing the snapshots
+            start = time.perf_counter()
+            try:
+                yield from merge_families([state.snapshot.families for state in states if state.snapshot is not None])
+            finally:
+                self.serialize_seconds = time.perf_counter() - start
+        else:
+            self.serialize_seconds = self.cache.metrics_render_seconds()
+
+        # Staleness metadata about the snapshots being served
+        account_labels = self.pollers[0].account_labels if self.pollers else []
+        last_success = GaugeMetricFamily('eero_exporter_last_refresh_success', '1 if the most recent refresh of eero data succeeded', labels = account_labels)
+        refresh_failures = CounterMetricFamily('eero_exporter_refresh_failures', 'Number of refreshes of eero data that failed', labels = account_labels)
+        refresh_backoff = GaugeMetricFamily('eero_exporter_refresh_backoff', 'Factor the refresh interval is stretched by after the eero api rate limited us', labels = account_labels)
+        snapshot_timestamp = GaugeMetricFamily('eero_exporter_snapshot_timestamp_seconds', 'Time in Epoch when the snapshot being served was taken', labels = account_labels)
+        snapshot_age = GaugeMetricFamily('eero_exporter_snapshot_age_seconds', 'Age of the snapshot being served', labels = account_labels, unit = "seconds")
+        refresh_duration = GaugeMetricFamily('eero_exporter_last_refresh_duration_seconds', 'Time taken by the last successful refresh of eero data',
+                                             labels = account_labels, unit = "seconds")
+        phase_duration = GaugeMetricFamily('eero_exporter_phase_duration_seconds',
+                                           'Time spent in each phase of the last refresh (fetch, parse, build) or of the last serialization of snapshots for /metrics (serialize)',
+                                           labels = ['phase'] + account_labels)
+
+        for poller, snapshot, success, failures, backoff in states:
+            last_success.add_metric(poller.account_values, 1 if success else 0)
+            refresh_failures.add_metric(poller.account_values, failures)
+            refresh_backoff.add_metric(poller.account_values, backoff)
+            if snapshot is not None:
+                snapshot_timestamp.add_metric(poller.account_values, snapshot.timestamp)
+                snapshot_age.add_metric(poller.account_values, time.time() - snapshot.timestamp)
+                refresh_duration.add_metric(poller.account_values, snapshot.duration)
+                for phase, seconds in snapshot.phases.items():
+                    phase_duration.add_metric([phase] + poller.account_values, seconds)
+        if self.serialize_seconds is not None:
+            # a scrape serializes every account at once, an empty label is the same as no label to prometheus
+            phase_duration.add_metric(["serialize"] + [""] * len(account_labels), self.serialize_seconds)
+
+        yield last_success
+        yield refresh_failures
+        yield refresh_backoff
+        yield snapshot_timestamp
+        yield snapshot_age
+        yield refresh_duration
+        yield phase_duration
+
+
+class Families(object):
+    """Just enough of a registry for the prometheus_client encoders to render families from an iterable"""
+    def __init__(self, families):
+        self.families = families
 
-                    for rx in client["connectivity"]["rx_rate_info"]:
-                        if client["connectivity"]["rx_rate_info"][rx] is not None:
-                            if rx != "rate_bps":
-                                metrics["client_rx_connection_details"].add_metric(client_label_values, value = {str(rx) : str(client["connectivity"]["rx_rate_info"][rx])})
-                    for tx in client["connectivity"]["tx_rate_info"]:
-                        if client["connectivity"]["tx_rate_info"][tx] is not None:
-                            if tx != "rate_bps":
-                                metrics["client_tx_connection_details"].add_metric(client_label_values, value = {str(tx) : str(client["connectivity"]["tx_rate_info"][tx])})
-
-                    metrics["client_connection_auth_type"].add_metric(client_label_values, value = {"auth" : client["auth"]})
-                    metrics["client_connection_channel"].add_metric(client_label_values, client["channel"])
-                if not client["wireless"]:
-                    metrics["client_wired_bandwidth"].add_metric(client_label_values, client["connectivity"]["ethernet_status"]["speed"][1:] * 1000000)
-
-                metrics['client_blacklisted'].add_metric(client_label_values, 0 if not client["blacklisted"] or client["blacklisted"] is None else 1)
-                metrics['client_paused'].add_metric(client_label_values, 0 if not client["paused"] or client["paused"] is None else 1)
-
-                metrics["client_guest"].add_metric(client_label_values, 1 if client["is_guest"] else 0)
-
-                if client["homekit"]["registered"]:
-                    metrics["client_homekit"].add_metric([client["homekit"]["protection_mode"]] + client_label_values, 1 if client["homekit"]["registered"] else 0)
-
-            for metric in metrics:
-                print("yielding " + metric)
-                yield metrics[metric]
-
-session = cookie_store.CookieStore('session.yml')
-eero_api_session = eero_api.Eero(session)
+    def collect(self):
+        return iter(self.families)
+
+
+# OpenMetrics bodies end with this, and only once
+OPENMETRICS_EOF = b'# EOF\n'
+
+
+class Rendered(object):
+    """Exposition of a set of families rendered once, so each scrape only renders and compresses what follows it
+
+    The gzip stream is flushed after the body and its compressor kept, so a scrape copies the compressor
+    state and compresses just the tail into one valid gzip stream.
+    """
+    def __init__(self, encoder, families):
+        start = time.perf_counter()
+        body = encoder(Families(families))
+        if body.endswith(OPENMETRICS_EOF):
+            body = body[:-len(OPENMETRICS_EOF)]
+        self.body = body
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.gzip_body = self.compressor.compress(body) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.render_seconds = time.perf_counter() - start
+
+    def output(self, tail, gzip = False):
+        if not gzip:
+            return self.body + tail
+        compressor = self.compressor.copy()
+        return self.gzip_body + compressor.compress(tail) + compressor.flush()
+
+
+class RenderCache(object):
+    """Rendered snapshots of sets of pollers by content type, re-rendered only once one of the snapshots changes"""
+    def __init__(self, pollers):
+        self.lock = threading.Lock()
+        # (content type, pollers) -> (snapshots, Rendered)
+        self.entries = {}
+        # what /metrics without an Accept header is served from
+        self.metrics_key = (choose_encoder(None)[1], tuple(pollers))
+
+    def metrics_render_seconds(self):
+        with self.lock:
+            entry = self.entries.get(self.metrics_key)
+        return entry[1].render_seconds if entry is not None else None
+
+    def get(self, content_type, encoder, states):
+        key = (content_type, tuple(state.poller for state in states))
+        snapshots = tuple(state.snapshot for state in states)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and all(cached is current for cached, current in zip(entry[0], snapshots)):
+            return entry[1]
+
+        rendered = Rendered(encoder, merge_families([snapshot.families for snapshot in snapshots if snapshot is not None]))
+        with self.lock:
+            self.entries[key] = (snapshots, rendered)
+        return rendered
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def make_app(pollers, registry = REGISTRY):
+    """WSGI app serving every account on /metrics, and only the accounts asked for on /probe?account=home&account=cabin
+
+    Snapshots are served from a RenderCache, which is warmed for /metrics as soon as a poller refreshes. Only the
+    staleness metadata, and for /metrics the rest of registry, is rendered per scrape. The metadata collector of
+    pollers is registered with registry.
+    """
+    cache = RenderCache(pollers)
+    registry.register(JsonCollector(pollers, cache))
+    by_account = {poller.account: poller for poller in pollers}
+
+    # what a scrape without an Accept header gets
+    default_encoder, default_content_type = choose_encoder(None)
+
+    def warm(poller):
+        cache.get(default_content_type, default_encoder, poller_states(pollers))
+    for poller in pollers:
+        poller.listeners.append(warm)
+
+    def app(environ, start_response):
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        if environ['PATH_INFO'] == '/favicon.ico':
+            start_response('200 OK', [])
+            return [b'']
+
+        if environ['PATH_INFO'] == '/probe':
+            names = []
+            for value in params.get('account', []):
+                names.extend(name for name in value.split(',') if name)
+            unknown = [name for name in names if name not in by_account]
+            if not names or unknown:
+                start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+                return [("unknown account " + ", ".join(unknown) if unknown else "account parameter is required").encode('utf-8')]
+            # each account once and in a fixed order, so there is one render cache entry per set of accounts
+            selected = [by_account[name] for name in sorted(set(names))]
+            tail_collector = JsonCollector(selected, cache)
+        else:
+            selected = pollers
+            tail_collector = registry
+
+        encoder, content_type = choose_encoder(environ.get('HTTP_ACCEPT'))
+        states = poller_states(selected)
+        if 'name[]' in params and tail_collector is registry:
+            # filtered scrapes are rare, so they are rendered from scratch
+            names = set(params['name[]'])
+            families = [family for family in merge_families([state.snapshot.families for state in states if state.snapshot is not None])
+                        if family.name in names or any(sample.name in names for sample in family.samples)]
+            rendered = Rendered(encoder, families)
+            tail_collector = registry.restricted_registry(names)
+        else:
+            rendered = cache.get(content_type, encoder, states)
+        tail = encoder(tail_collector)
+
+        headers = [('Content-Type', content_type)]
+        gzip = gzip_accepted(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if gzip:
+            headers.append(('Content-Encoding', 'gzip'))
+        start_response('200 OK', headers)
+        return [rendered.output(tail, gzip)]
+    app.render_cache = cache
+    return app
 
 
 if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument("-port", help="port to run the exporter on")
+    parser.add_argument("-interval", help="seconds between refreshes of client data")
+    parser.add_argument("-network-interval", help="seconds between refreshes of account and network data (config and health), defaults to -interval. "
+                        "Longer values save only the account request and network config per refresh, and lag network health")
+    parser.add_argument("-concurrency", help="maximum number of eero api requests in flight at once")
+    parser.add_argument("-timeout", help="seconds to wait for each eero api request")
+    parser.add_argument("-retries", help="times to retry eero api requests that failed or were rate limited")
+    parser.add_argument("-client-labels", help="comma separated client labels to keep, client_mac is always kept")
+    parser.add_argument("-client-top-n", help="only export the clients of each network with the highest bitrate")
+    parser.add_argument("-client-mode", help="clients for per-client metrics, aggregate for per-eero client aggregates, or both")
+    parser.add_argument("-config", help="yaml file listing the accounts to export, instead of the single account in session.yml")
+    parser.add_argument("-events-file", help="file to append client and eero change events to, as JSON lines")
+    parser.add_argument("-events-webhook", help="url to POST client and eero change events to, as a JSON array per refresh")
+    parser.add_argument("-api-endpoint", help="eero api url template, e.g. http://localhost:9119/2.2/{} to use a replay.py server")
+    parser.add_argument("-log-level", help="DEBUG, INFO, WARNING or ERROR", default="INFO")
     args = parser.parse_args()
 
+    logging.basicConfig(level = args.log_level.upper(), format = "%(asctime)s %(levelname)s %(name)s: %(message)s")
+
     if args.port:
         port = int(args.port)
     else:
         port = 9118
-    REGISTRY.register(JsonCollector())
-    print("starting http server")
-    start_http_server(port)
-
-    coll = JsonCollector()
-    while True:
-        coll.collect()
-        time.sleep(1)
+    if args.interval:
+        interval = float(args.interval)
+    else:
+        interval = 60
+    if args.network_interval:
+        network_interval = float(args.network_interval)
+    else:
+        # network health comes with the network config, so it is only slowed down when asked to
+        network_interval = interval
+    if args.concurrency:
+        concurrency = int(args.concurrency)
+    else:
+        concurrency = 8
+    if args.timeout:
+        timeout = float(args.timeout)
+    else:
+        timeout = 10
+    if args.retries:
+        retries = int(args.retries)
+    else:
+        retries = 3
+
+    builder_options = {}
+    if args.client_labels is not None:
+        builder_options["client_labels"] = [label.strip() for label in args.client_labels.split(",") if label.strip()]
+    if args.client_top_n:
+        builder_options["client_top_n"] = int(args.client_top_n)
+    if args.client_mode:
+        builder_options["client_mode"] = args.client_mode
+    # fail on bad options now rather than on every refresh
+    metric_schema.FamilyBuilder(**builder_options)
+
+    if args.config:
+        accounts = load_accounts(args.config)
+    else:
+        accounts = [Account(None, 'session.yml')]
+
+    # client telemetry changes every few seconds, network config hardly ever
+    ttls = {"account": network_interval, "networks": network_interval, "devices": interval}
+    executor = ThreadPoolExecutor(max_workers = concurrency, thread_name_prefix = "eero-fetch")
+    pollers = []
+    for account in accounts:
+        api = serialize_session_refresh(eero_api.Eero(cookie_store.CookieStore(account.session)))
+        api.client = transport.PooledClient(timeout, concurrency, retries, api_endpoint = args.api_endpoint, account = account.name)
+        pollers.append(Poller(api, interval, concurrency, ttls, builder_options, account.name, executor))
+
+    sinks = []
+    if args.events_file:
+        sinks.append(change_events.FileSink(args.events_file))
+    if args.events_webhook:
+        sinks.append(change_events.WebhookSink(args.events_webhook, timeout))
+    for poller in pollers:
+        poller.listeners.extend(sinks)
+
+    app = make_app(pollers)
+    # Scrapes are served from the latest snapshots, the eero api is only called from the pollers
+    for poller in pollers:
+        threading.Thread(target = poller.run, name = "poller-" + str(poller.account), daemon = True).start()
+
+    log.info("starting http server on port %d", port)
+    httpd = make_server('', port, app, ThreadingWSGIServer, handler_class = QuietHandler)
+    httpd.serve_forever()
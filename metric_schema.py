@@ -0,0 +1,489 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from functools import lru_cache
+import heapq
+from prometheus_client.core import GaugeHistogramMetricFamily, GaugeMetricFamily, InfoMetricFamily
+
+# Every metric the exporter serves from eero data, declared once at startup.
+#
+# Each MetricSpec belongs to a scope, which decides the object its extractor is handed and the labels
+# its samples carry:
+#   account_network - a network entry of account()['networks']['data']
+#   network         - the networks() response for that network
+#   eero            - an eero in networks()['eeros']['data']
+#   client          - a client in the devices() response
+#   eero_clients    - the connected clients of one eero, for aggregates that replace per-client series
+#
+# An extractor takes the scope object and yields (extra label values, value) for every sample it has,
+# where the value is a number for gauges, a dict for info metrics or (buckets, sum) for gauge histograms.
+# Adding a metric is one table entry.
+
+NETWORK_LABELS = ['network_id', 'network_name', 'network_display_name']
+EERO_LABELS = ["eero_id", "eero_name"] + NETWORK_LABELS
+CLIENT_LABELS = ["client_mac", "client_hostname", "client_display_name"] + EERO_LABELS
+
+SCOPE_LABELS = {
+    "account_network": NETWORK_LABELS,
+    "network": NETWORK_LABELS,
+    "eero": EERO_LABELS,
+    "client": CLIENT_LABELS,
+    "eero_clients": EERO_LABELS,
+}
+
+# How per-client data is exported, see FamilyBuilder
+CLIENT_MODES = ["clients", "aggregate", "both"]
+
+SIGNAL_BUCKETS = [-90, -80, -70, -60, -50, -40]
+
+EERO_FEATURES = ["upnp", "ipv6", "thread", "sqm", "band_steering", "wpa3", "amazon_account_linked", "alexa_skill", "amazon_device_nickname", "backup_internet_enabled", "power_saving"]
+CLIENT_DETAILS = ["manufacturer"]
+
+
+class MetricSpec(namedtuple('MetricSpec', ['key', 'family_type', 'name', 'documentation', 'scope', 'extra_labels', 'unit', 'extract'])):
+    @property
+    def labels(self):
+        return self.extra_labels + SCOPE_LABELS[self.scope]
+
+    def family(self, labels = None):
+        labels = self.labels if labels is None else self.extra_labels + labels
+        if self.unit is not None:
+            return self.family_type(self.name, self.documentation, labels = labels, unit = self.unit)
+        return self.family_type(self.name, self.documentation, labels = labels)
+
+    def adder(self, family):
+        if self.family_type is GaugeHistogramMetricFamily:
+            return lambda labels, value: family.add_metric(labels, value[0], value[1])
+        return family.add_metric
+
+
+def gauge(key, name, documentation, scope, extract, extra_labels = (), unit = None):
+    return MetricSpec(key, GaugeMetricFamily, name, documentation, scope, list(extra_labels), unit, extract)
+
+
+def info(key, name, documentation, scope, extract, extra_labels = ()):
+    return MetricSpec(key, InfoMetricFamily, name, documentation, scope, list(extra_labels), None, extract)
+
+
+def gauge_histogram(key, name, documentation, scope, extract, extra_labels = (), unit = None):
+    return MetricSpec(key, GaugeHistogramMetricFamily, name, documentation, scope, list(extra_labels), unit, extract)
+
+
+# Extractors
+
+NO_LABELS = []
+
+
+def lookup(data, path):
+    for key in path:
+        data = data[key]
+    return data
+
+
+def number(*path, scale = 1):
+    def extract(data):
+        yield NO_LABELS, lookup(data, path) * scale
+    return extract
+
+
+def flag(*path):
+    def extract(data):
+        yield NO_LABELS, 1 if lookup(data, path) else 0
+    return extract
+
+
+def equals(expected, *path):
+    def extract(data):
+        yield NO_LABELS, 1 if lookup(data, path) == expected else 0
+    return extract
+
+
+@lru_cache(maxsize = 8192)
+def parse_timestamp(value):
+    """Seconds since Epoch of an eero api timestamp such as 2024-01-02T03:04:05.678Z, which are always in UTC
+
+    Most timestamps (last_active, last_heartbeat, last_reboot) repeat from one refresh to the next, so results are memoized.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        # fromisoformat only accepts 3 or 6 fractional digits before python 3.11
+        parsed = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ" if "." in value else "%Y-%m-%dT%H:%M:%SZ")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo = timezone.utc)
+    return parsed.timestamp()
+
+
+def timestamp(*path):
+    def extract(data):
+        value = lookup(data, path)
+        yield NO_LABELS, parse_timestamp(value) if value is not None else 0
+    return extract
+
+
+def text(label, *path):
+    def extract(data):
+        yield NO_LABELS, {label: lookup(data, path)}
+    return extract
+
+
+def joined(label, *path):
+    def extract(data):
+        yield NO_LABELS, {label: ", ".join(lookup(data, path))}
+    return extract
+
+
+def when(predicate, extractor):
+    def extract(data):
+        if predicate(data):
+            yield from extractor(data)
+    return extract
+
+
+def supported_features(network):
+    for feature, capability in network["capabilities"].items():
+        yield [feature], 1 if capability["capable"] else 0
+
+
+def dhcp_settings(network):
+    yield NO_LABELS, {"dhcp_mode": network["dhcp"]["mode"]}
+    if network["dhcp"]["mode"] != "automatic":
+        yield NO_LABELS, {"dhcp_subnet_mask": network["dhcp"]["custom"]["subnet_mask"]}
+        yield NO_LABELS, {"dhcp_subnet_ip": network["dhcp"]["custom"]["subnet_ip"]}
+
+
+def dns_settings(network):
+    dns = network["dns"]
+    yield NO_LABELS, {"dns_mode": dns["mode"]}
+    yield NO_LABELS, {"dns_caching": "true" if dns["caching"] else "false"}
+    yield NO_LABELS, {"dns_server": ", ".join(dns["custom"]["ips"] if dns["mode"] == "custom" else dns["parent"]["ips"])}
+
+
+def premium_dns_policies(network):
+    for policy, enabled in network["premium_dns"]["dns_policies"].items():
+        if enabled:
+            yield NO_LABELS, {"policy": policy}
+
+
+def has_homekit(network):
+    return network["homekit"] is not None
+
+
+def eero_model(eero):
+    yield NO_LABELS, {"model": eero["model"]}
+    yield NO_LABELS, {"model_number": eero["model_number"]}
+
+
+def eero_mac_addresses(eero):
+    yield NO_LABELS, {"mac_address": ", ".join(eero["ethernet_addresses"] + eero["wifi_bssids"])}
+
+
+def mesh_quality(eero):
+    yield NO_LABELS, eero["mesh_quality_bars"] / 5 if eero["mesh_quality_bars"] is not None else 0
+
+
+def mesh_connection_type(eero):
+    yield NO_LABELS, {"connection": eero["connection_type"] if eero["connection_type"] is not None else "DISCONNECTED"}
+
+
+def eero_ipv6_addresses(eero):
+    yield NO_LABELS, {"ipv6_address": ", ".join(ipv6["address"] for ipv6 in eero["ipv6_addresses"])}
+
+
+def client_details(client):
+    for detail in CLIENT_DETAILS:
+        if client[detail] is not None:
+            yield NO_LABELS, {detail: client[detail]}
+
+
+def client_ips(client):
+    for ip in client["ips"]:
+        yield NO_LABELS, {"ip": ip}
+
+
+def is_wireless(client):
+    return client["wireless"]
+
+
+def is_wired(client):
+    return not client["wireless"]
+
+
+def connection_strength(client):
+    signal = client_signal(client)
+    if signal is not None:
+        yield NO_LABELS, signal
+
+
+def rate(direction):
+    def extract(client):
+        rate_bps = client["connectivity"][direction + "_rate_info"]["rate_bps"]
+        yield NO_LABELS, rate_bps if rate_bps is not None else 0
+    return extract
+
+
+def connection_details(client):
+    for direction in ("rx", "tx"):
+        for detail, value in client["connectivity"][direction + "_rate_info"].items():
+            if value is not None and detail != "rate_bps":
+                yield NO_LABELS, {"direction": direction, str(detail): str(value)}
+
+
+def wired_bandwidth(client):
+    # link speeds are strings like "P100", in Mbps
+    yield NO_LABELS, int(client["connectivity"]["ethernet_status"]["speed"][1:]) * 1000000
+
+
+def client_homekit(client):
+    if client["homekit"]["registered"]:
+        yield [client["homekit"]["protection_mode"]], 1
+
+
+def client_band(client):
+    if not client["wireless"]:
+        return "wired"
+    frequency = client["connectivity"]["frequency"]
+    if frequency is None:
+        return "unknown"
+    # reported in MHz, but accept GHz too
+    ghz = frequency / 1000 if frequency > 100 else frequency
+    if ghz < 3:
+        return "2.4GHz"
+    if ghz < 5.925:
+        return "5GHz"
+    return "6GHz"
+
+
+def client_signal(client):
+    """Signal strength of a wireless client in dBm, from strings like '-45 dBm'"""
+    signal = client["connectivity"].get("signal") if client["wireless"] else None
+    if signal is None:
+        return None
+    return float(signal.split()[0])
+
+
+def client_bandwidth(client):
+    """Combined rx and tx bitrate of a client, used to rank clients for -client-top-n"""
+    if not client["wireless"]:
+        return 0
+    rx = client["connectivity"]["rx_rate_info"]["rate_bps"]
+    tx = client["connectivity"]["tx_rate_info"]["rate_bps"]
+    return (rx or 0) + (tx or 0)
+
+
+def clients_by_band(clients):
+    counts = dict.fromkeys(["2.4GHz", "5GHz", "6GHz", "wired"], 0)
+    for client in clients:
+        band = client_band(client)
+        counts[band] = counts.get(band, 0) + 1
+    for band, count in counts.items():
+        yield [band], count
+
+
+def signal_histogram(clients):
+    signals = [signal for signal in map(client_signal, clients) if signal is not None]
+    buckets = [(str(bound), sum(1 for signal in signals if signal <= bound)) for bound in SIGNAL_BUCKETS]
+    buckets.append(("+Inf", len(signals)))
+    yield NO_LABELS, (buckets, sum(signals))
+
+
+def summed_rate(direction):
+    def extract(clients):
+        total = 0
+        for client in clients:
+            if client["wireless"]:
+                total += client["connectivity"][direction + "_rate_info"]["rate_bps"] or 0
+        yield NO_LABELS, total
+    return extract
+
+
+SCHEMA = [
+    # Network-specific metrics
+    info("ssid", 'eero_network_ssid', 'Current Eero Network SSID and Nickname, will always output 1 if detected', "account_network", text("ssid", "name")),
+    gauge("supported_feature", 'eero_network_feature_supported', 'If the Eero Network can support feature, output 1 if supported', "network", supported_features, extra_labels = ['feature']),
+    info("wan_ip", 'eero_network_wan_ip', 'WAN IP for the Eero Network, should be your Public IP if you are in a double nat', "network", text("wan_ip", "wan_ip")),
+    info("connection_mode", 'eero_network_connection', 'What the Eero Network is connected to', "network", text("connection", "connection", "mode")),
+    info("dhcp", 'eero_network_dhcp', 'Configured DHCP Settings for the Eero Network', "network", dhcp_settings),
+    info("dns", 'eero_network_dns', 'Configured DNS Settings for the Eero Network', "network", dns_settings),
+] + [
+    gauge(feature, 'eero_network_' + feature, 'If ' + feature + ' is enabled, output 1 if enabled', "network", flag(feature)) for feature in EERO_FEATURES
+] + [
+    gauge("client_count", 'eero_network_client_count', 'Total amount of clients connected to network', "network", number("clients", "count")),
+    # converting to bits per second per Prometheus unit standards
+    gauge("upload_bandwidth", 'eero_network_upload_bandwidth', 'Upload Speed in Bits per Second', "network", number("speed", "up", "value", scale = 1000000), unit = "bps"),
+    gauge("download_bandwidth", 'eero_network_download_bandwidth', 'Upload Speed in Bits per Second', "network", number("speed", "down", "value", scale = 1000000), unit = "bps"),
+    gauge("bandwidth_last_test", 'eero_network_bandwidth_last_test', 'Last time that bandwidth test was performed', "network", timestamp("speed", "date")),
+    info("update_version", 'eero_network_update_version', 'Current Eero version of network', "network", text("version", "updates", "target_firmware")),
+    gauge("has_update", 'eero_network_update_available', 'Eero network has available update, 1 if true', "network", flag("updates", "has_update")),
+    gauge("last_update", 'eero_network_update_date', 'Datetime of last Eero update', "network", timestamp("updates", "last_update_started")),
+    gauge("internet_health", 'eero_network_internet_up', '1 if Eero reporting successful internet connection', "network", equals("connected", "health", "internet", "status")),
+    gauge("eero_health", 'eero_network_up', '1 if Eero network reporting healthy', "network", equals("connected", "health", "eero_network", "status")),
+    info("public_ip", 'eero_network_public_ip', 'Public IP address of Eero network', "network", text("ip", "ip_settings", "public_ip")),
+    gauge("double_nat", 'eero_network_double_nat', '1 if Eero detects that it detects it is behind an existing NAT', "network", flag("ip_settings", "double_nat")),
+    gauge("premium_dns_enabled", 'eero_network_premium_dns_enabled', '1 if Eero Secure Plus DNS settings are enabled', "network", flag("premium_dns", "dns_policies_enabled")),
+    info("premium_dns_policies", 'eero_network_premium_dns_policies', 'Premium DNS policies enabled on network', "network", premium_dns_policies),
+    gauge("homekit_enabled", 'eero_network_homekit_enabled', '1 if Eero connected to Apple Homekit', "network", when(has_homekit, flag("homekit", "enabled"))),
+    gauge("homekit_managed_network", 'eero_network_homekit_managed_network_enabled', '1 if Homekit Managed Network is enabled on Eero Routers', "network",
+          when(has_homekit, flag("homekit", "managedNetworkEnabled"))),
+    gauge("guest_ssid_enabled", 'eero_network_guest_ssid_enabled', '1 if Guest Network is enabled', "network", flag("guest_network", "enabled")),
+    info("guest_ssid", 'eero_network_guest_ssid', 'SSID of Guest Network', "network", text("ssid", "guest_network", "name")),
+    gauge("last_reboot", 'eero_network_last_restart', 'Time of last full network restart', "network", timestamp("last_reboot")),
+    gauge("ddns_enabled", 'eero_network_ddns_enabled', '1 if Dynamic DNS is enabled', "network", flag("ddns", "enabled")),
+    info("ddns_subdomain", 'eero_network_ddns_subdomain', 'Unique domain with public IP as A record', "network", text("domain", "ddns", "subdomain")),
+
+    # Eero-specific metrics
+    gauge("eero_count", 'eero_network_eero_count', 'Amount of Eeros connected to network', "network", number("eeros", "count")),
+    info("eero_model", 'eero_network_eero_model', 'Eero Model Name and Number', "eero", eero_model),
+    info("eero_mac", 'eero_network_eero_mac', 'Eero Router MAC Addresses', "eero", eero_mac_addresses),
+    gauge("eero_mesh_connection_quality", 'eero_network_eero_mesh_connection_quality',
+          'Connection quality of Eeros to mesh network as a percentage, gateway Eero will always be 100%', "eero", mesh_quality),
+    info("eero_mesh_connection_type", 'eero_network_eero_mesh_connection_type',
+         'If the connection type is either Wired or Wireless, Gateway Eero will always be WIRED', "eero", mesh_connection_type),
+    gauge("eero_gateway", 'eero_network_eero_gateway', 'Outputs 1 if Gateway Eero', "eero", flag("gateway")),
+    gauge("eero_status", 'eero_network_eero_status', 'Outputs 1 if Eero is in a Good (green) Status', "eero", equals("green", "status")),
+    gauge("eero_client_count", 'eero_network_eero_client_count', 'The amount of clients connected to Eero Router', "eero", number("connected_clients_count")),
+    gauge("eero_heartbeat", 'eero_network_eero_heartbeat', '1 if Eero is passing heartbeat checks', "eero", flag("heartbeat_ok")),
+    gauge("eero_last_heartbeat", 'eero_network_eero_last_heartbeat', 'Date and Time in Epoch of last successful Heartbeat', "eero", timestamp("last_heartbeat")),
+    gauge("eero_wifi", 'eero_network_eero_wifi_enabled', 'If wireless connectivity is enabled on the Eero, 1 if enabled', "eero", flag("provides_wifi")),
+    info("eero_wifi_bands", 'eero_network_eero_wifi_bands', 'Enabled Wireless Bands of Eero', "eero", joined("band", "bands")),
+    info("eero_ipv4", 'eero_network_eero_ipv4', 'Eero Router IPv4 Address', "eero", text("ipv4_address", "ip_address")),
+    info("eero_ipv6", 'eero_network_eero_ipv6', 'Eero Router IPv6 Address', "eero", eero_ipv6_addresses),
+    info("eero_version", 'eero_network_eero_version', 'Current OS version of Eero', "eero", text("version", "os")),
+    gauge("eero_last_reboot", 'eero_network_eero_last_restart',
+          'Last restart of eero device, value does not update with full network restarts (see eero_network_last_restart)', "eero", timestamp("last_reboot")),
+
+    # Client-specific metrics
+    info("client_details", 'eero_network_client_details', "miscellaneous collected details of connected clients", "client", client_details),
+    info("client_ip", 'eero_network_client_ip', 'ip addresses of connected clients', "client", client_ips),
+    gauge("client_connected", 'eero_network_client_connected', 'if client is currently connected to the network', "client", flag("connected")),
+    info("client_connection_type", 'eero_network_client_connection_type', 'how the client is connected to the network, generally either wired or wireless', "client",
+         text("connection", "connection_type")),
+    gauge("client_last_active", 'eero_network_client_last_active', 'time when client was last active', "client", timestamp("last_active")),
+    gauge("client_connection_strength", 'eero_network_client_connection_strength', 'connection strength in dBm', "client", when(is_wireless, connection_strength), unit = "dBm"),
+    gauge("client_connection_quality", 'eero_network_client_connection_quality', 'connection quality as a percentage, 1 is best quality. wired connections will not appear', "client",
+          when(is_wireless, number("connectivity", "score"))),
+    gauge("client_connection_wireless_frequency", 'eero_network_client_connection_frequency', 'wireless frequency client is connected via', "client",
+          when(is_wireless, number("connectivity", "frequency"))),
+    gauge("client_rx_bandwidth", 'eero_network_client_rx_bandwidth', 'client receive bandwidth in bits per second', "client", when(is_wireless, rate("rx")), unit = "bps"),
+    gauge("client_tx_bandwidth", 'eero_network_client_tx_bandwidth', 'client transmit bandwidth in bits per second', "client", when(is_wireless, rate("tx")), unit = "bps"),
+    info("client_connection_details", 'eero_network_client_connection_details', 'miscellaneous collected client receive (rx) and transmit (tx) connection details', "client",
+         when(is_wireless, connection_details)),
+    info("client_connection_auth_type", 'eero_network_client_connection_auth', 'authentication method of the wireless device', "client", when(is_wireless, text("auth", "auth"))),
+    gauge("client_connection_channel", 'eero_network_client_connection_channel', 'wireless channel that client is connected via', "client", when(is_wireless, number("channel"))),
+    gauge("client_wired_bandwidth", 'eero_network_client_wired_bandwidth', 'bandwidth of wired client in bits per second', "client", when(is_wired, wired_bandwidth), unit = "bps"),
+    gauge("client_blacklisted", 'eero_network_client_blacklisted', 'if client is blocked from connecting to the network, 1 if true', "client", flag("blacklisted")),
+    gauge("client_paused", 'eero_network_client_paused', 'if client is temporarily blocked from connecting to the network, 1 if true', "client", flag("paused")),
+    gauge("client_guest", 'eero_network_client_guest', '1 if client is connected to guest network', "client", flag("is_guest")),
+    gauge("client_homekit", 'eero_network_client_homekit', '1 if client is registered with homekit secure router network', "client", client_homekit, extra_labels = ["protection_mode"]),
+
+    # Per-eero aggregates of connected clients, exported instead of or alongside per-client metrics
+    gauge("eero_clients_by_band", 'eero_network_eero_clients_by_band', 'Connected clients of Eero by wireless band, wired clients have band wired', "eero_clients",
+          clients_by_band, extra_labels = ["band"]),
+    gauge_histogram("eero_client_signal", 'eero_network_eero_client_signal', 'Signal strength of wireless clients connected to Eero in dBm', "eero_clients",
+                    signal_histogram, unit = "dBm"),
+    gauge("eero_client_rx_bandwidth", 'eero_network_eero_client_rx_bandwidth', 'Summed receive bandwidth of wireless clients connected to Eero in bits per second', "eero_clients",
+          summed_rate("rx"), unit = "bps"),
+    gauge("eero_client_tx_bandwidth", 'eero_network_eero_client_tx_bandwidth', 'Summed transmit bandwidth of wireless clients connected to Eero in bits per second', "eero_clients",
+          summed_rate("tx"), unit = "bps"),
+]
+
+
+def network_label_values(network):
+    return [network['url'].split('/')[3], network["name"], network["nickname_label"] if network["nickname_label"] is not None else network["name"]]
+
+
+def eero_label_values(eero, network_labels):
+    return [eero['url'].split('/')[3], eero["location"]] + network_labels
+
+
+def client_label_values(client, network_labels):
+    return [client["mac"], client["hostname"] if client["hostname"] is not None else "", client["display_name"] if client["display_name"] is not None else "",
+            client["source"]["url"].split('/')[3], client["source"]["location"]] + network_labels
+
+
+class FamilyBuilder(object):
+    """Walks eero api data for any number of networks, appending samples to one family per schema entry
+
+    Per-client series can be bounded with:
+      client_labels - client labels to keep from CLIENT_LABELS, client_mac is always kept as it identifies the client
+      client_top_n  - only export the client_top_n clients of each network with the highest combined rx/tx bitrate
+      client_mode   - "clients" for per-client series, "aggregate" for per-eero client aggregates, or "both"
+
+    When account is given every sample also carries an account label, so several accounts can share families.
+    """
+    def __init__(self, client_labels = None, client_top_n = None, client_mode = "clients", account = None):
+        if client_mode not in CLIENT_MODES:
+            raise ValueError("client mode must be one of " + ", ".join(CLIENT_MODES))
+        self.client_top_n = client_top_n
+        scopes = ["account_network", "network", "eero"]
+        if client_mode in ("clients", "both"):
+            scopes.append("client")
+        if client_mode in ("aggregate", "both"):
+            scopes.append("eero_clients")
+
+        own_labels = CLIENT_LABELS[:-len(NETWORK_LABELS)]
+        if client_labels is None:
+            client_labels = own_labels
+        unknown = set(client_labels) - set(own_labels)
+        if unknown:
+            raise ValueError("unknown client labels " + ", ".join(sorted(unknown)))
+        self.client_label_indexes = [i for i, name in enumerate(own_labels) if name == "client_mac" or name in client_labels]
+        self.account_labels = ["account"] if account is not None else []
+        self.account_values = [account] if account is not None else []
+        client_label_names = [own_labels[i] for i in self.client_label_indexes] + NETWORK_LABELS
+
+        self.families = {}
+        self.extractors = {scope: [] for scope in scopes}
+        for spec in SCHEMA:
+            if spec.scope not in self.extractors:
+                continue
+            family = spec.family((client_label_names if spec.scope == "client" else SCOPE_LABELS[spec.scope]) + self.account_labels)
+            self.families[spec.key] = family
+            self.extractors[spec.scope].append((spec.adder(family), spec.extract))
+
+    def add(self, scope, data, label_values):
+        for add_metric, extract in self.extractors[scope]:
+            for extra_labels, value in extract(data):
+                add_metric(extra_labels + label_values if extra_labels else label_values, value)
+
+    def add_network(self, network, network_details, network_clients, network_eeros = None):
+        """Adds the samples of one network, or none at all if its data can't be read, and re-raises
+
+        Eeros are read from network_eeros when given, which is fetched more often, and from network_details otherwise.
+        """
+        sample_counts = [(family, len(family.samples)) for family in self.families.values()]
+        try:
+            self.add_network_samples(network, network_details, network_clients,
+                                     network_eeros if network_eeros is not None else network_details["eeros"]["data"])
+        except Exception:
+            for family, count in sample_counts:
+                del family.samples[count:]
+            raise
+
+    def add_network_samples(self, network, network_details, network_clients, network_eeros):
+        label_values = network_label_values(network) + self.account_values
+        self.add("account_network", network, label_values)
+        self.add("network", network_details, label_values)
+        for eero in network_eeros:
+            self.add("eero", eero, eero_label_values(eero, label_values))
+
+        if "client" in self.extractors:
+            clients = network_clients
+            if self.client_top_n is not None:
+                clients = heapq.nlargest(self.client_top_n, clients, key = client_bandwidth)
+            for client in clients:
+                client_labels = client_label_values(client, [])
+                self.add("client", client, [client_labels[i] for i in self.client_label_indexes] + label_values)
+
+        if "eero_clients" in self.extractors:
+            # every eero gets aggregates, even without clients
+            eero_clients = {}
+            for eero in network_eeros:
+                eero_clients[eero['url'].split('/')[3]] = (eero_label_values(eero, label_values), [])
+            for client in network_clients:
+                if client["connected"]:
+                    eero_id = client["source"]["url"].split('/')[3]
+                    if eero_id not in eero_clients:
+                        eero_clients[eero_id] = ([eero_id, client["source"]["location"]] + label_values, [])
+                    eero_clients[eero_id][1].append(client)
+            for eero_labels, clients in eero_clients.values():
+                self.add("eero_clients", clients, eero_labels)
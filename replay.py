@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""Records, synthesizes and replays eero api responses, to run the exporter and its benchmarks without the eero cloud
+
+    python replay.py record -session session.yml -out home.json
+    python replay.py synthesize -networks 4 -eeros 5 -clients 50 -out large.json
+    python replay.py serve home.json -port 9119
+    python eero_exporter.py -api-endpoint 'http://localhost:9119/2.2/{}'
+
+A fixture maps eero api actions (account, networks/<id>, networks/<id>/eeros, networks/<id>/devices) to the data of their responses.
+"""
+from argparse import ArgumentParser
+from eero.client import Client
+from eero.exception import ClientException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import copy
+import eero as eero_api
+import ipaddress
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+log = logging.getLogger("eero_exporter.replay")
+
+MAC = re.compile(r'\b[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5}\b')
+IPV4 = re.compile(r'\b(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})\b')
+# account contact details, redacted whole
+REDACTED_KEYS = {"email", "phone"}
+
+
+def load(path):
+    with open(path) as stream:
+        return json.load(stream)
+
+
+def save(fixture, path):
+    with open(path, 'w') as stream:
+        json.dump(fixture, stream, indent = 1, sort_keys = True)
+
+
+def network_actions(network_url):
+    network_id = network_url.rstrip('/').split('/')[-1]
+    return "networks/" + network_id, "networks/" + network_id + "/eeros", "networks/" + network_id + "/devices"
+
+
+def record(api):
+    """Fetches everything the exporter reads from the eero api, anonymised"""
+    fixture = {"account": api.account()}
+    for network in fixture["account"]["networks"]["data"]:
+        network_action, eeros_action, devices_action = network_actions(network["url"])
+        fixture[network_action] = api.networks(network["url"])
+        fixture[eeros_action] = api.eeros(network["url"])
+        fixture[devices_action] = api.devices(network["url"])
+    return Anonymiser().anonymise(fixture)
+
+
+class Anonymiser(object):
+    """Replaces MAC and IP addresses with made up ones, consistently so the same address maps to the same stand-in
+
+    IPv4 addresses keep their last octet and are mapped per /24 so subnets still line up, and netmasks are kept.
+    Hostnames, network names and SSIDs are kept, review a recording before sharing it.
+    """
+    def __init__(self):
+        self.macs = {}
+        self.ipv4_prefixes = {}
+        self.ipv6 = {}
+
+    def anonymise(self, value, key = None):
+        if key in REDACTED_KEYS and value is not None:
+            return "redacted"
+        if isinstance(value, dict):
+            return {k: self.anonymise(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.anonymise(v, key) for v in value]
+        if isinstance(value, str):
+            return self.text(value)
+        return value
+
+    def text(self, value):
+        value = MAC.sub(self.mac, value)
+        value = IPV4.sub(self.ipv4, value)
+        if ':' in value:
+            address, _, prefix = value.partition('/')
+            try:
+                ipaddress.IPv6Address(address)
+            except ValueError:
+                return value
+            if address not in self.ipv6:
+                self.ipv6[address] = "fd00::%x" % (len(self.ipv6) + 1)
+            value = self.ipv6[address] + ('/' + prefix if prefix else '')
+        return value
+
+    def mac(self, match):
+        mac = match.group(0).lower()
+        if mac not in self.macs:
+            n = len(self.macs) + 1
+            # locally administered, so it can't clash with a real device
+            self.macs[mac] = "02:00:00:%02x:%02x:%02x" % (n >> 16 & 0xff, n >> 8 & 0xff, n & 0xff)
+        return self.macs[mac]
+
+    def ipv4(self, match):
+        octets = match.groups()
+        if any(int(octet) > 255 for octet in octets) or octets[0] in ("0", "255"):
+            return match.group(0)
+        prefix = octets[:3]
+        if prefix not in self.ipv4_prefixes:
+            n = len(self.ipv4_prefixes) + 1
+            self.ipv4_prefixes[prefix] = "10.%d.%d" % (n >> 8 & 0xff, n & 0xff)
+        return self.ipv4_prefixes[prefix] + "." + octets[3]
+
+
+def synthesize(networks, eeros, clients, seed = 0):
+    """Fixture of an account with networks networks, each with eeros eeros and clients clients"""
+    rng = random.Random(seed)
+    fixture = {"account": {
+        "name": "Replay", "email": {"value": "redacted"}, "phone": {"value": "redacted"},
+        "networks": {"count": networks, "data": [
+            {"url": "/2.2/networks/%d" % (100 + n), "name": "network-%d" % n, "nickname_label": None} for n in range(networks)]},
+    }}
+    for n in range(networks):
+        network_action, eeros_action, devices_action = network_actions("/2.2/networks/%d" % (100 + n))
+        fixture[network_action] = synthesize_network(rng, n, eeros, clients)
+        fixture[eeros_action] = fixture[network_action]["eeros"]["data"]
+        fixture[devices_action] = [synthesize_client(rng, n, c, eeros) for c in range(clients)]
+    return fixture
+
+
+def synthesize_eero(rng, n, e):
+    return {
+        "url": "/2.2/eeros/%d" % (1000 * (100 + n) + e), "location": "room-%d" % e, "serial": "S%06d%03d" % (n, e),
+        "model": rng.choice(["eero Pro 6", "eero 6", "eero Beacon"]), "model_number": rng.choice(["K010001", "N010001", "B010001"]),
+        "gateway": e == 0, "status": "green", "heartbeat_ok": rng.random() > 0.05, "last_heartbeat": "2024-01-02T03:04:05.678Z",
+        "connection_type": "WIRED" if e == 0 else rng.choice(["WIRED", "WIRELESS"]), "mesh_quality_bars": rng.randint(1, 5),
+        "connected_clients_count": 0, "provides_wifi": True, "bands": ["2.4GHz", "5GHz"], "os": "v6.13.2",
+        "ethernet_addresses": ["a0:00:%02x:%02x:%02x:01" % (n >> 8 & 0xff, n & 0xff, e)], "wifi_bssids": ["a0:00:%02x:%02x:%02x:02" % (n >> 8 & 0xff, n & 0xff, e)],
+        "ip_address": "192.168.%d.%d" % (n % 256, e + 1), "ipv6_addresses": [{"address": "fd00::%x:%x" % (n, e + 1)}],
+        "last_reboot": "2024-01-01T00:00:00.000Z",
+    }
+
+
+def synthesize_network(rng, n, eeros, clients):
+    return {
+        "name": "network-%d" % n, "wan_ip": "203.0.113.%d" % (n % 256), "connection": {"mode": "auto"},
+        "capabilities": {"ac": {"capable": True}, "thread": {"capable": rng.random() > 0.5}},
+        "dhcp": {"mode": "automatic", "custom": {"subnet_mask": "255.255.255.0", "subnet_ip": "192.168.%d.0" % (n % 256)}},
+        "dns": {"mode": "automatic", "caching": True, "parent": {"ips": ["1.1.1.1"]}, "custom": {"ips": []}},
+        "upnp": True, "ipv6": True, "thread": False, "sqm": False, "band_steering": True, "wpa3": False,
+        "amazon_account_linked": False, "alexa_skill": False, "amazon_device_nickname": False,
+        "backup_internet_enabled": False, "power_saving": False,
+        "clients": {"count": clients},
+        "speed": {"up": {"value": round(rng.uniform(5, 50), 3)}, "down": {"value": round(rng.uniform(50, 900), 3)}, "date": "2024-01-02T03:04:05Z"},
+        "updates": {"target_firmware": "v6.13.2", "has_update": False, "last_update_started": "2024-01-01T00:00:00.123Z"},
+        "health": {"internet": {"status": "connected"}, "eero_network": {"status": "connected"}},
+        "ip_settings": {"public_ip": "203.0.113.%d" % (n % 256), "double_nat": False},
+        "premium_dns": {"dns_policies_enabled": True, "dns_policies": {"block_malware": True, "ad_block": False}},
+        "last_reboot": None, "homekit": {"enabled": False, "managedNetworkEnabled": False},
+        "guest_network": {"name": "guest-%d" % n, "enabled": True}, "ddns": {"enabled": True, "subdomain": "replay%d" % n},
+        "eeros": {"count": eeros, "data": [synthesize_eero(rng, n, e) for e in range(eeros)]},
+    }
+
+
+def synthesize_client(rng, n, c, eeros):
+    e = rng.randrange(eeros)
+    client = {
+        "mac": "c0:%02x:%02x:%02x:%02x:%02x" % (n >> 8 & 0xff, n & 0xff, c >> 16 & 0xff, c >> 8 & 0xff, c & 0xff),
+        "hostname": rng.choice([None, "host-%d" % c]), "display_name": rng.choice([None, "device %d" % c]),
+        "manufacturer": rng.choice([None, "Apple", "Google", "Sonos"]), "ips": ["192.168.%d.%d" % (n % 256, 10 + c % 240)],
+        "source": {"url": "/2.2/eeros/%d" % (1000 * (100 + n) + e), "location": "room-%d" % e},
+        "connected": rng.random() > 0.2, "last_active": "2024-01-02T03:%02d:%02d.000Z" % (c // 60 % 60, c % 60),
+        "blacklisted": False, "paused": rng.choice([None, False]), "is_guest": rng.random() > 0.9,
+        "homekit": {"registered": False, "protection_mode": None},
+    }
+    if rng.random() > 0.15:
+        frequency = rng.choice([2437, 5180, 5745])
+        client.update({
+            "connection_type": "wireless", "wireless": True, "auth": "wpa2", "channel": 6 if frequency == 2437 else 36,
+            "interface": {"frequency": "2.4" if frequency == 2437 else "5"},
+            "connectivity": {
+                "signal": "%d dBm" % rng.randint(-90, -35), "score": round(rng.random(), 2), "frequency": frequency,
+                "rx_rate_info": {"rate_bps": rng.choice([None, rng.randrange(6, 1200) * 1000000]), "mcs": rng.randint(0, 11), "nss": rng.randint(1, 2), "bw": None},
+                "tx_rate_info": {"rate_bps": rng.randrange(6, 1200) * 1000000, "mcs": rng.randint(0, 11), "nss": rng.randint(1, 2)},
+            },
+        })
+    else:
+        client.update({
+            "connection_type": "wired", "wireless": False,
+            "connectivity": {"signal": None, "ethernet_status": {"speed": rng.choice(["P100", "P1000"])}},
+        })
+    return client
+
+
+class ReplayClient(Client):
+    """eero api client answering GETs from a fixture in memory, to measure the exporter without any HTTP"""
+    def __init__(self, fixture):
+        self.fixture = fixture
+
+    def get(self, action, **kwargs):
+        if action not in self.fixture:
+            raise ClientException(404, "error.not_found")
+        # callers own what they get back, like a freshly decoded response
+        return copy.deepcopy(self.fixture[action])
+
+    def post(self, action, **kwargs):
+        return {"user_token": "replay"}
+
+
+class ReplaySession(eero_api.SessionStorage):
+    cookie = "replay"
+
+
+def replay_api(fixture):
+    """Eero api object backed by a ReplayClient"""
+    api = eero_api.Eero(ReplaySession())
+    api.client = ReplayClient(fixture)
+    return api
+
+
+class ReplayServer(object):
+    """Local HTTP stand-in for the eero api serving a fixture, every response delayed by latency seconds
+
+    Point a client at api_endpoint, e.g. transport.PooledClient(timeout, api_endpoint = server.api_endpoint).
+    """
+    def __init__(self, fixture, port = 0, latency = 0):
+        self.fixture = fixture
+        self.latency = latency
+        # encoded once, the server should not be what a benchmark measures
+        self.responses = {action: json.dumps({"meta": {"code": 200}, "data": data}).encode('utf-8') for action, data in fixture.items()}
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self.handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.api_endpoint = "http://127.0.0.1:%d/2.2/{}" % self.port
+        self.thread = None
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                log.debug(format, *args)
+
+            def do_GET(self):
+                action = self.path.split('?')[0].split('/2.2/', 1)[-1].strip('/')
+                body = server.responses.get(action)
+                if body is None:
+                    self.respond(404, {"meta": {"code": 404, "error": "error.not_found"}})
+                else:
+                    self.respond(200, body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.respond(200, {"meta": {"code": 200}, "data": {"user_token": "replay"}})
+
+            def respond(self, status, body):
+                if server.latency:
+                    time.sleep(server.latency)
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target = self.httpd.serve_forever, name = "replay-server", daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("command", help="record, synthesize or serve")
+    parser.add_argument("fixture", help="fixture to serve", nargs="?")
+    parser.add_argument("-session", help="session store of the account to record", default="session.yml")
+    parser.add_argument("-out", help="file to write a recorded or synthesized fixture to")
+    parser.add_argument("-networks", help="networks to synthesize", default=1, type=int)
+    parser.add_argument("-eeros", help="eeros per synthesized network", default=3, type=int)
+    parser.add_argument("-clients", help="clients per synthesized network", default=20, type=int)
+    parser.add_argument("-seed", help="seed for synthesized values", default=0, type=int)
+    parser.add_argument("-port", help="port to serve on", default=9119, type=int)
+    parser.add_argument("-latency", help="seconds to delay every response by", default=0, type=float)
+    args = parser.parse_args()
+
+    logging.basicConfig(level = "INFO", format = "%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.command == "record":
+        import cookie_store
+        fixture = record(eero_api.Eero(cookie_store.CookieStore(args.session)))
+    elif args.command == "synthesize":
+        fixture = synthesize(args.networks, args.eeros, args.clients, args.seed)
+    elif args.command == "serve":
+        if not args.fixture:
+            parser.error("serve needs a fixture")
+        server = ReplayServer(load(args.fixture), args.port, args.latency)
+        log.info("serving %s on %s", args.fixture, server.api_endpoint)
+        server.httpd.serve_forever()
+    else:
+        parser.error("unknown command " + args.command)
+
+    if args.out:
+        save(fixture, args.out)
+        log.info("wrote %s", args.out)
+    else:
+        print(json.dumps(fixture, indent = 1, sort_keys = True))
@@ -5,14 +5,15 @@ from eero.exception import ClientException
 import six
 import cookie_store
 
-session = cookie_store.CookieStore('session.yml')
-eero = eero.Eero(session)
-
 if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-l", help="your eero login (email address or phone number)")
+    parser.add_argument("-session", help="session store to initialise, one per account", default="session.yml")
+    args = parser.parse_args()
+
+    session = cookie_store.CookieStore(args.session)
+    eero = eero.Eero(session)
     if eero.needs_login():
-        parser = ArgumentParser()
-        parser.add_argument("-l", help="your eero login (email address or phone number)")
-        args = parser.parse_args()
         if args.l:
             account_info = args.l
         else:
@@ -21,6 +22,6 @@ if __name__ == '__main__':
             user_token = eero.login(account_info)
             verification_code = six.moves.input('verification key from email or SMS: ')
             eero.login_verify(verification_code, user_token)
-            print('Session key stored in session.yml')
+            print('Session key stored in ' + args.session)
         except ClientException as cex:
             print('Error: status {}, message {}'.format(cex.status, cex.error_message))
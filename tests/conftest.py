@@ -0,0 +1,38 @@
+# python -m pytest, from the repository root
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+import eero_exporter
+import pytest
+import replay
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers = 2)
+    yield executor
+    executor.shutdown(wait = True)
+
+
+@pytest.fixture
+def make_poller(executor):
+    """Makes Pollers backed by a replayed fixture, a small synthesized account by default"""
+    def make(fixture = None, interval = 60, **kwargs):
+        if fixture is None:
+            fixture = replay.synthesize(1, 2, 5)
+        return eero_exporter.Poller(replay.replay_api(fixture), interval, executor = executor, **kwargs)
+    return make
+
+
+@pytest.fixture
+def wsgi_get():
+    """Calls a WSGI app, returning (status, headers, body)"""
+    def get(app, path, query = "", **headers):
+        environ = {}
+        setup_testing_defaults(environ)
+        environ['PATH_INFO'] = path
+        environ['QUERY_STRING'] = query
+        environ.update(headers)
+        response = []
+        body = b"".join(app(environ, lambda status, response_headers: response.append((status, dict(response_headers)))))
+        return response[0][0], response[0][1], body
+    return get
@@ -0,0 +1,54 @@
+from prometheus_client import REGISTRY
+import change_events
+import replay
+
+
+def test_heartbeat_flip_is_seen_with_a_slow_network_tier(make_poller):
+    fixture = replay.synthesize(1, 2, 5)
+    fixture["networks/100/eeros"] = [dict(eero, heartbeat_ok = True) for eero in fixture["networks/100/eeros"]]
+    # eeros and devices are fetched on every refresh, networks only once
+    poller = make_poller(fixture, ttls = {"account": 600, "networks": 600, "devices": 0})
+    poller.refresh()
+
+    fixture["networks/100/eeros"][1]["heartbeat_ok"] = False
+    poller.refresh()
+    assert [(event["event"], event["eero_id"]) for event in poller.events] == [("heartbeat_lost", "100001")]
+
+
+def test_failing_listener_does_not_stop_polling(make_poller):
+    calls = []
+
+    def broken(poller):
+        calls.append(poller.snapshot.timestamp)
+        raise RuntimeError("sink is down")
+
+    poller = make_poller()
+    poller.listeners.append(broken)
+    # an exception escaping refresh would end Poller.run and its thread
+    poller.refresh()
+    poller.refresh()
+    assert len(calls) == 2
+
+
+def test_file_sink_counts_events_it_cannot_write(make_poller, tmp_path):
+    before = REGISTRY.get_sample_value('eero_exporter_event_sink_errors_total', {'sink': 'file'}) or 0
+    poller = make_poller()
+    poller.events = [{"event": "join", "time": object()}]
+    change_events.FileSink(str(tmp_path / "events.jsonl"))(poller)
+    assert REGISTRY.get_sample_value('eero_exporter_event_sink_errors_total', {'sink': 'file'}) == before + 1
+
+
+def test_eero_counts_follow_renames_and_removals(make_poller):
+    fixture = replay.synthesize(1, 3, 5)
+    fixture["networks/100/eeros"][:] = [dict(eero, heartbeat_ok = True) for eero in fixture["networks/100/eeros"]]
+    poller = make_poller(fixture)
+    poller.refresh()
+    fixture["networks/100/eeros"][1]["heartbeat_ok"] = False
+    poller.refresh()
+
+    fixture["networks/100/eeros"][1]["location"] = "attic"
+    del fixture["networks/100/eeros"][2]
+    poller.refresh()
+    lost = {(sample.labels["eero_id"], sample.labels["eero_name"]): sample.value for family in poller.changes.families()
+            for sample in family.samples if sample.labels.get("change") == "lost"}
+    assert lost == {("100000", "room-0"): 0, ("100001", "attic"): 1}
@@ -0,0 +1,31 @@
+from prometheus_client.core import CollectorRegistry, GaugeMetricFamily
+from prometheus_client.exposition import choose_encoder
+import eero_exporter
+import gzip
+
+OPENMETRICS = "application/openmetrics-text; version=1.0.0"
+
+
+def test_gzip_tail_is_spliced_into_one_stream():
+    family = GaugeMetricFamily('eero_test', 'A test gauge', labels = ['n'])
+    for n in range(100):
+        family.add_metric([str(n)], n)
+    rendered = eero_exporter.Rendered(choose_encoder(None)[0], [family])
+    for tail in (b"", b"eero_tail 1.0\n", b"eero_other_tail 2.0\n"):
+        assert gzip.decompress(rendered.output(tail, gzip = True)) == rendered.body + tail
+        assert rendered.output(tail) == rendered.body + tail
+
+
+def test_openmetrics_ends_with_one_eof(make_poller, wsgi_get):
+    poller = make_poller()
+    poller.refresh()
+    app = eero_exporter.make_app([poller], CollectorRegistry(auto_describe = False))
+    for encoding in ("", "gzip"):
+        # twice, so the second is served from the render cache
+        for _ in range(2):
+            _, headers, body = wsgi_get(app, "/metrics", HTTP_ACCEPT = OPENMETRICS, HTTP_ACCEPT_ENCODING = encoding)
+            if encoding:
+                assert headers['Content-Encoding'] == 'gzip'
+                body = gzip.decompress(body)
+            assert body.endswith(b"\n# EOF\n")
+            assert body.count(b"# EOF") == 1
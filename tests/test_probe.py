@@ -0,0 +1,60 @@
+from prometheus_client.core import CollectorRegistry
+from prometheus_client.parser import text_string_to_metric_families
+import eero_exporter
+import pytest
+
+
+@pytest.fixture
+def make_app(make_poller):
+    def make(*accounts):
+        pollers = [make_poller(account = account) for account in accounts]
+        for poller in pollers:
+            poller.refresh()
+        return eero_exporter.make_app(pollers, CollectorRegistry(auto_describe = False))
+    return make
+
+
+def sample_lines(body):
+    return [line for line in body.decode('utf-8').splitlines() if line and not line.startswith('#') and "age_seconds" not in line]
+
+
+def test_probe_repeated_account_is_served_once(make_app, wsgi_get):
+    app = make_app("home", "cabin")
+    _, _, once = wsgi_get(app, "/probe", "account=home")
+    for query in ("account=home,home", "account=home&account=home", "account=home,home,home"):
+        status, _, body = wsgi_get(app, "/probe", query)
+        assert status.startswith("200")
+        lines = sample_lines(body)
+        assert len(lines) == len(set(lines))
+        assert len(lines) == len(sample_lines(once))
+
+
+def test_probe_account_order_shares_a_render(make_app, wsgi_get):
+    app = make_app("home", "cabin")
+    _, _, body = wsgi_get(app, "/probe", "account=home,cabin")
+    wsgi_get(app, "/probe", "account=cabin,home")
+    wsgi_get(app, "/probe", "account=cabin&account=home&account=cabin")
+    assert len(app.render_cache.entries) == 1
+
+    accounts = {sample.labels.get("account") for family in text_string_to_metric_families(body.decode('utf-8')) for sample in family.samples}
+    assert {"home", "cabin"} <= accounts
+
+
+def test_probe_unknown_account(make_app, wsgi_get):
+    status, _, body = wsgi_get(make_app("home"), "/probe", "account=nope")
+    assert status.startswith("400")
+    assert b"nope" in body
+
+
+def test_serialize_phase_is_the_metrics_render(make_app, wsgi_get):
+    app = make_app("home", "cabin")
+    wsgi_get(app, "/metrics")
+    metrics = app.render_cache.entries[app.render_cache.metrics_key][1]
+    wsgi_get(app, "/probe", "account=home")
+    wsgi_get(app, "/metrics", HTTP_ACCEPT = "application/openmetrics-text; version=1.0.0")
+    assert len(app.render_cache.entries) == 3
+
+    _, _, body = wsgi_get(app, "/metrics")
+    serialize = [sample.value for family in text_string_to_metric_families(body.decode('utf-8')) for sample in family.samples
+                 if sample.name == "eero_exporter_phase_duration_seconds" and sample.labels["phase"] == "serialize"]
+    assert serialize == [metrics.render_seconds]
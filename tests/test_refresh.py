@@ -0,0 +1,35 @@
+import metric_schema
+import replay
+
+
+def samples(poller, name):
+    return [sample for family in poller.snapshot.families for sample in family.samples if sample.name == name]
+
+
+def test_network_that_cannot_be_read_is_left_out(make_poller):
+    fixture = replay.synthesize(3, 2, 5)
+    del fixture["networks/101"]["ddns"]
+    poller = make_poller(fixture)
+    poller.refresh()
+
+    assert poller.snapshot is not None
+    success = {sample.labels["network_id"]: sample.value for sample in samples(poller, "eero_network_refresh_success")}
+    assert success == {"100": 1, "101": 0, "102": 1}
+    errors = {(sample.labels["network_id"], sample.labels["endpoint"]): sample.value for sample in samples(poller, "eero_network_refresh_errors_total")}
+    assert errors == {("101", "parse"): 1}
+    # nothing half built from the broken network
+    schema_names = {spec.name for spec in metric_schema.SCHEMA}
+    network_ids = {sample.labels.get("network_id") for family in poller.snapshot.families if family.name in schema_names for sample in family.samples}
+    assert network_ids == {"100", "102"}
+
+
+def test_errors_of_departed_network_are_dropped(make_poller):
+    fixture = replay.synthesize(2, 2, 5)
+    del fixture["networks/101"]["ddns"]
+    poller = make_poller(fixture)
+    poller.refresh()
+    assert {sample.labels["network_id"] for sample in samples(poller, "eero_network_refresh_errors_total")} == {"101"}
+
+    fixture["account"]["networks"]["data"].pop()
+    poller.refresh()
+    assert samples(poller, "eero_network_refresh_errors_total") == []
@@ -0,0 +1,45 @@
+import heapq
+import metric_schema
+import pytest
+import replay
+
+
+def build(**options):
+    """Families of one synthesized network, by key"""
+    fixture = replay.synthesize(1, 3, 20)
+    builder = metric_schema.FamilyBuilder(**options)
+    builder.add_network(fixture["account"]["networks"]["data"][0], fixture["networks/100"], fixture["networks/100/devices"])
+    return builder.families, fixture["networks/100/devices"]
+
+
+def scope_keys(scope):
+    return {spec.key for spec in metric_schema.SCHEMA if spec.scope == scope}
+
+
+def test_client_labels_always_keep_the_mac():
+    families, clients = build(client_labels = ["client_hostname"])
+    samples = families["client_connected"].samples
+    assert len(samples) == len(clients)
+    assert {tuple(sorted(sample.labels)) for sample in samples} == {tuple(sorted(["client_mac", "client_hostname"] + metric_schema.NETWORK_LABELS))}
+
+
+def test_client_top_n_keeps_the_fastest_clients():
+    families, clients = build(client_top_n = 3)
+    fastest = {client["mac"] for client in heapq.nlargest(3, clients, key = metric_schema.client_bandwidth)}
+    for key in scope_keys("client"):
+        assert {sample.labels["client_mac"] for sample in families[key].samples} <= fastest
+    assert {sample.labels["client_mac"] for sample in families["client_connected"].samples} == fastest
+
+
+@pytest.mark.parametrize("mode, client, aggregate", [("clients", True, False), ("aggregate", False, True), ("both", True, True)])
+def test_client_mode_picks_the_client_families(mode, client, aggregate):
+    families, _ = build(client_mode = mode)
+    assert scope_keys("client") & set(families) == (scope_keys("client") if client else set())
+    assert scope_keys("eero_clients") & set(families) == (scope_keys("eero_clients") if aggregate else set())
+    assert all(families[key].samples for key in scope_keys("eero_clients") & set(families))
+
+
+@pytest.mark.parametrize("options", [{"client_mode": "some"}, {"client_labels": ["client_ip"]}])
+def test_bad_client_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        metric_schema.FamilyBuilder(**options)
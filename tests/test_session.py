@@ -0,0 +1,43 @@
+from eero.exception import ClientException
+import eero_exporter
+import replay
+import threading
+import time
+
+
+class ExpiringClient(replay.ReplayClient):
+    """Answers error.session.refresh to any session but the latest, and rotates the session on every refresh"""
+    def __init__(self, fixture):
+        replay.ReplayClient.__init__(self, fixture)
+        self.lock = threading.Lock()
+        self.session = "t0"
+        self.refreshes = 0
+
+    def get(self, action, cookies = None, **kwargs):
+        # long enough for every concurrent request to see the same expired session
+        time.sleep(0.05)
+        if (cookies or {}).get('s') != self.session:
+            raise ClientException(401, 'error.session.refresh')
+        return replay.ReplayClient.get(self, action)
+
+    def post(self, action, **kwargs):
+        with self.lock:
+            self.refreshes += 1
+            self.session = "t" + str(self.refreshes)
+            return {"user_token": self.session}
+
+
+def test_expired_session_is_refreshed_once(make_poller):
+    fixture = replay.synthesize(4, 2, 5)
+    poller = make_poller(fixture, ttls = {"account": 600, "networks": 600, "devices": 0})
+    client = ExpiringClient(fixture)
+    poller.api.client = client
+    poller.api.session.cookie = "t0"
+    eero_exporter.serialize_session_refresh(poller.api)
+    poller.refresh()
+
+    client.session = "expired"
+    poller.refresh()
+    assert poller.last_refresh_success
+    assert client.refreshes == 1
+    assert poller.api.session.cookie == client.session
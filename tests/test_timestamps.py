@@ -0,0 +1,30 @@
+from metric_schema import parse_timestamp
+import calendar
+import pytest
+import time
+
+EPOCH = calendar.timegm((2024, 1, 2, 3, 4, 5))
+
+
+@pytest.fixture
+def local_time_not_utc(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    parse_timestamp.cache_clear()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+    parse_timestamp.cache_clear()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-01-02T03:04:05Z", EPOCH),
+    ("2024-01-02T03:04:05.678Z", EPOCH + 0.678),
+    ("2024-01-02T03:04:05.678123Z", EPOCH + 0.678123),
+    # the strptime fallback, for fractions fromisoformat rejects before python 3.11
+    ("2024-01-02T03:04:05.67Z", EPOCH + 0.67),
+    ("2024-01-02T03:04:05+00:00", EPOCH),
+])
+def test_timestamps_are_utc(local_time_not_utc, value, expected):
+    assert time.timezone != 0
+    assert parse_timestamp(value) == pytest.approx(expected)
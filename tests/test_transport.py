@@ -0,0 +1,111 @@
+from eero.exception import ClientException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from prometheus_client import REGISTRY
+import json
+import pytest
+import requests
+import threading
+import transport
+
+
+class ScriptedServer(object):
+    """Answers requests with scripted (status, headers, data) responses in order, and records the headers of each request"""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                self.respond()
+
+            def respond(self):
+                server.requests.append((self.command, dict(self.headers)))
+                status, headers, data = server.responses.pop(0)
+                body = b"" if status == 304 else json.dumps({"meta": {"code": status}, "data": data}).encode('utf-8')
+                self.send_response(status)
+                for name, value in dict(headers, **{"Content-Length": str(len(body))}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.api_endpoint = "http://127.0.0.1:%d/2.2/{}" % self.httpd.server_address[1]
+        threading.Thread(target = self.httpd.serve_forever, args = (0.05,), daemon = True).start()
+
+    def client(self, **kwargs):
+        return transport.PooledClient(5, retry_backoff = 0, api_endpoint = self.api_endpoint, **kwargs)
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(*responses):
+        servers.append(ScriptedServer(*responses))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def responses(account, endpoint, code):
+    return REGISTRY.get_sample_value('eero_exporter_api_responses_total', {'endpoint': endpoint, 'code': code, 'account': account}) or 0
+
+
+def test_failed_get_is_retried(serve):
+    server = serve((503, {}, None), (200, {}, {"name": "home"}))
+    before = responses("retried", "account", "503")
+    assert server.client(account = "retried").get("account") == {"name": "home"}
+    assert len(server.requests) == 2
+    assert responses("retried", "account", "503") == before + 1
+
+
+def test_post_is_not_retried(serve):
+    server = serve((503, {}, None), (200, {}, {"user_token": "t"}))
+    with pytest.raises(ClientException):
+        server.client().post("login/refresh")
+    assert len(server.requests) == 1
+
+
+def test_retry_after_is_capped():
+    response = requests.Response()
+    assert transport.retry_after(response) is None
+    response.headers['Retry-After'] = "2.5"
+    assert transport.retry_after(response) == 2.5
+    response.headers['Retry-After'] = "3600"
+    assert transport.retry_after(response) == transport.MAX_RETRY_DELAY
+    # http dates are not supported, the jittered backoff is used instead
+    response.headers['Retry-After'] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert transport.retry_after(response) is None
+
+
+def test_rate_limit_is_reported_once(serve):
+    server = serve((429, {"Retry-After": "0"}, None), (200, {}, []))
+    client = server.client()
+    assert client.get("networks/1/devices") == []
+    assert client.take_rate_limited()
+    assert not client.take_rate_limited()
+
+
+def test_not_modified_reuses_the_last_response(serve):
+    server = serve((200, {"ETag": '"v1"'}, [{"mac": "c0:00"}]), (304, {"ETag": '"v1"'}, None))
+    client = server.client()
+    first = client.get("networks/1/devices")
+    assert client.get("networks/1/devices") == first == [{"mac": "c0:00"}]
+    assert "If-None-Match" not in server.requests[0][1]
+    assert server.requests[1][1]["If-None-Match"] == '"v1"'
@@ -0,0 +1,158 @@
+from eero.client import Client
+from eero.exception import ClientException
+from prometheus_client import Counter, Histogram
+from requests.adapters import HTTPAdapter
+import logging
+import random
+import requests
+import threading
+import time
+
+log = logging.getLogger("eero_exporter.transport")
+
+# Self-instrumentation, to tell time spent waiting on the eero cloud apart from time spent in the exporter.
+# account is empty when a single account is exported, which Prometheus treats as no label at all
+API_LATENCY = Histogram('eero_exporter_api_request_duration_seconds', 'Latency of eero api requests', ['endpoint', 'account'],
+                        buckets = (.05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+API_RESPONSES = Counter('eero_exporter_api_responses', 'eero api responses by HTTP status code', ['endpoint', 'code', 'account'])
+API_ERRORS = Counter('eero_exporter_api_errors', 'Failed eero api requests, by eero status code or the exception raised', ['endpoint', 'error', 'account'])
+
+# Responses worth trying again after a pause
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 60
+
+
+def endpoint_name(action):
+    """Names an api action by its last non-numeric path segment, networks/123/devices is devices"""
+    return [segment for segment in action.split('/') if not segment.isdigit()][-1]
+
+
+def retry_after(response):
+    try:
+        return min(float(response.headers['Retry-After']), MAX_RETRY_DELAY)
+    except (KeyError, ValueError):
+        return None
+
+
+class PooledClient(Client):
+    """eero api client sharing one pool of keep-alive connections between all requests
+
+    On top of the upstream client it:
+      - gives up on requests taking longer than timeout seconds
+      - asks for gzip responses and revalidates GETs with ETag/Last-Modified, reusing the last response on a 304
+      - retries GETs that failed to connect or returned 429/5xx up to retries times, with jittered exponential backoff
+      - remembers being rate limited until the poller asks, so it can stretch its refresh interval
+      - instruments every request, labelled with account when given
+    """
+    def __init__(self, timeout, pool_size = 8, retries = 3, retry_backoff = 0.5, api_endpoint = None, account = None):
+        if api_endpoint is not None:
+            # e.g. a replay.py server standing in for the eero cloud
+            self.API_ENDPOINT = api_endpoint
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.account = account if account is not None else ""
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip'
+
+        self.lock = threading.Lock()
+        # url -> (conditional request headers, data of the response they validate)
+        self.validators = {}
+        self.rate_limited = False
+        # total time spent decoding responses, requests run on several threads
+        self.parse_seconds = 0
+
+    def get(self, action, **kwargs):
+        return self.request('GET', action, **kwargs)
+
+    def post(self, action, **kwargs):
+        return self.request('POST', action, **kwargs)
+
+    def take_rate_limited(self):
+        """True if the api answered 429 since the last call"""
+        with self.lock:
+            rate_limited, self.rate_limited = self.rate_limited, False
+        return rate_limited
+
+    def request(self, method, action, **kwargs):
+        endpoint = endpoint_name(action)
+        url = self.API_ENDPOINT.format(action)
+        kwargs.setdefault('timeout', self.timeout)
+
+        cached = None
+        if method == 'GET':
+            with self.lock:
+                cached = self.validators.get(url)
+            if cached is not None:
+                kwargs['headers'] = dict(kwargs.get('headers') or {}, **cached[0])
+
+        response = self.send(method, url, endpoint, self.retries if method == 'GET' else 0, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            return cached[1]
+
+        data = self.parse(response, endpoint)
+        if method == 'GET':
+            validators = {}
+            if 'ETag' in response.headers:
+                validators['If-None-Match'] = response.headers['ETag']
+            if 'Last-Modified' in response.headers:
+                validators['If-Modified-Since'] = response.headers['Last-Modified']
+            with self.lock:
+                if validators:
+                    self.validators[url] = (validators, data)
+                else:
+                    self.validators.pop(url, None)
+        return data
+
+    def send(self, method, url, endpoint, retries, **kwargs):
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as ex:
+                API_ERRORS.labels(endpoint, type(ex).__name__, self.account).inc()
+                if attempt == retries:
+                    raise
+                delay = None
+                reason = repr(ex)
+            else:
+                API_RESPONSES.labels(endpoint, str(response.status_code), self.account).inc()
+                if response.status_code == 429:
+                    with self.lock:
+                        self.rate_limited = True
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                delay = retry_after(response)
+                reason = "status " + str(response.status_code)
+            finally:
+                API_LATENCY.labels(endpoint, self.account).observe(time.perf_counter() - start)
+
+            if delay is None:
+                # full jitter, so retries from concurrent requests spread out
+                delay = random.uniform(0, min(MAX_RETRY_DELAY, self.retry_backoff * 2 ** attempt))
+            log.debug("retrying %s in %.2fs after %s", endpoint, delay, reason)
+            time.sleep(delay)
+
+    def parse(self, response, endpoint):
+        start = time.perf_counter()
+        try:
+            try:
+                return self._parse_response(response)
+            except ValueError:
+                # error pages from proxies and load balancers are not json
+                if response.status_code < 400:
+                    raise
+                raise ClientException(response.status_code, response.reason)
+        except ClientException as ex:
+            API_ERRORS.labels(endpoint, str(ex.status), self.account).inc()
+            raise
+        except ValueError as ex:
+            API_ERRORS.labels(endpoint, type(ex).__name__, self.account).inc()
+            raise
+        finally:
+            with self.lock:
+                self.parse_seconds += time.perf_counter() - start